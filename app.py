@@ -1,57 +1,530 @@
 from dotenv import load_dotenv
 
-from flask import Flask, render_template, request, redirect, url_for, jsonify, session
+from flask import (Flask, render_template, request, redirect, url_for, jsonify, session, g,
+                   Response, abort, send_file, make_response)
+from markupsafe import Markup, escape
+from werkzeug.security import safe_join
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.base import STATE_RUNNING
+from apscheduler.jobstores.base import BaseJobStore, ConflictingIdError, JobLookupError
+from apscheduler.job import Job
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
+from apscheduler.util import datetime_to_utc_timestamp, utc_timestamp_to_datetime
 import logging
 from pytz import timezone
 import threading
+import queue
 import atexit
+import fcntl
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from functools import wraps
+from time import monotonic, perf_counter, sleep
 import gspread
 import re
+import sqlite3
+from contextlib import closing, contextmanager
 from oauth2client.service_account import ServiceAccountCredentials
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import base64
+import hashlib
 import json
+import pickle
+import random
+import secrets
 import os
+import gzip
+import zlib
+import mimetypes
+from io import BytesIO
+
+try:
+    from PIL import Image, ImageOps, features as pil_features
+except ImportError:  # Templates fall back to the original photos
+    Image = None
+
+try:
+    import brotli
+except ImportError:  # Assets are precompressed with gzip only
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:  # Fonts are fingerprinted but not subset
+    font_subset = None
 
 load_dotenv()
 
 logger = logging.getLogger(__name__)
 
+# Local state (ID counter etc.) lives outside the spreadsheet
+STATE_DIR = os.environ.get('STATE_DIR', os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'state'))
+os.makedirs(STATE_DIR, exist_ok=True)
+STATE_DB = os.path.join(STATE_DIR, 'state.db')
+
+
+def state_db():
+    """Connection to the local SQLite state database (WAL, durable commits)"""
+    conn = sqlite3.connect(STATE_DB, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=FULL")
+    return conn
+
+
+@contextmanager
+def try_process_lock(name):
+    """
+    Non-blocking exclusive lock shared by all processes on this host.
+    Yields True if acquired, False if another process holds it.
+    """
+    with open(os.path.join(STATE_DIR, f'{name}.lock'), 'a') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def try_acquire_lease(name):
+    """
+    Take the lock `name` for the rest of this process's life. Returns the open
+    lock file (keep a reference) or None if another process holds it. The OS
+    drops the lock when the holder exits, however it dies.
+    """
+    lock_file = open(os.path.join(STATE_DIR, f'{name}.lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    return lock_file
+
 # Create Flask app
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY')
+# Proxies in front of the app; remote_addr is the client's address from their
+# X-Forwarded-For entry. Off unless set, since without a proxy clients could
+# forge the header (gunicorn.conf.py sets it to 1 behind Render's router)
+TRUSTED_PROXIES = int(os.environ.get('TRUSTED_PROXIES', 0))
+if TRUSTED_PROXIES:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=TRUSTED_PROXIES)
+
+# =============================================================================
+# METRICS
+# =============================================================================
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+
+
+class Metrics:
+    """
+    Minimal in-process metrics registry rendered in the Prometheus text
+    format. Values are per gunicorn worker.
+    """
+
+    def __init__(self):
+        self._meta = {}       # name -> (type, help)
+        self._values = {}     # name -> {labels: value or histogram state}
+        self._gauges = {}     # name -> callable returning {labels: value}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text):
+        self._meta[name] = ('counter', help_text)
+        self._values.setdefault(name, {})
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help_text, buckets)
+        self._values.setdefault(name, {})
+
+    def gauge(self, name, help_text, collect):
+        """`collect()` returns a number or a {labels tuple: value} dict at scrape time"""
+        self._meta[name] = ('gauge', help_text)
+        self._gauges[name] = collect
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        buckets = self._meta[name][2]
+        with self._lock:
+            state = self._values[name].setdefault(
+                key, {'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0})
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+            state['sum'] += value
+            state['count'] += 1
+
+    @staticmethod
+    def _labels(key, extra=()):
+        pairs = list(key) + list(extra)
+        if not pairs:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in pairs)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = []
+        with self._lock:
+            snapshot = {name: {k: (dict(v, counts=list(v['counts'])) if isinstance(v, dict) else v)
+                               for k, v in series.items()}
+                        for name, series in self._values.items()}
+        for name, meta in self._meta.items():
+            lines.append(f"# HELP {name} {meta[1]}")
+            lines.append(f"# TYPE {name} {meta[0]}")
+            if meta[0] == 'gauge':
+                try:
+                    value = self._gauges[name]()
+                except Exception as e:
+                    print(f"Metrics gauge {name} failed: {e}")
+                    continue
+                series = value if isinstance(value, dict) else {(): value}
+                for key, v in series.items():
+                    lines.append(f"{name}{self._labels(key)} {v}")
+            elif meta[0] == 'counter':
+                for key, v in snapshot[name].items():
+                    lines.append(f"{name}{self._labels(key)} {v}")
+            else:
+                for key, state in snapshot[name].items():
+                    for bound, count in zip(meta[2], state['counts']):
+                        lines.append(f"{name}_bucket{self._labels(key, [('le', bound)])} {count}")
+                    lines.append(f"{name}_bucket{self._labels(key, [('le', '+Inf')])} {state['count']}")
+                    lines.append(f"{name}_sum{self._labels(key)} {state['sum']}")
+                    lines.append(f"{name}_count{self._labels(key)} {state['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+metrics = Metrics()
+metrics.histogram('http_request_duration_seconds', 'Flask request latency by route')
+metrics.counter('http_requests_total', 'Flask requests by route, method and status')
+metrics.histogram('outbound_request_duration_seconds', 'Outbound call latency by dependency')
+metrics.counter('outbound_requests_total', 'Outbound calls by dependency, operation and outcome')
+metrics.histogram('sheets_quota_wait_seconds', 'Time spent waiting for a Sheets quota token')
+metrics.histogram('scheduler_job_duration_seconds', 'Scheduled job run time')
+metrics.counter('scheduler_job_runs_total', 'Scheduled job runs by outcome')
+metrics.counter('booking_submissions_total', 'Booking form submissions by outcome')
+
+
+@contextmanager
+def track_outbound(dependency, operation):
+    """
+    Time an outbound call. The caller may set call['outcome'] (e.g. on a
+    non-2xx response); an exception records 'error'.
+    """
+    call = {'outcome': 'success'}
+    started = perf_counter()
+    try:
+        yield call
+    except Exception:
+        call['outcome'] = 'error'
+        raise
+    finally:
+        metrics.observe('outbound_request_duration_seconds',
+                        perf_counter() - started, dependency=dependency)
+        metrics.inc('outbound_requests_total', dependency=dependency,
+                    operation=operation, outcome=call['outcome'])
+
+
+def timed_job(job_id):
+    """Decorator recording a scheduler job's run time and outcome"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            outcome = 'success'
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                outcome = 'error'
+                raise
+            finally:
+                metrics.observe('scheduler_job_duration_seconds',
+                                perf_counter() - started, job=job_id)
+                metrics.inc('scheduler_job_runs_total', job=job_id, outcome=outcome)
+        return wrapper
+    return decorator
+
+
+@app.before_request
+def _start_request_timer():
+    g.request_started = perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        metrics.observe('http_request_duration_seconds',
+                        perf_counter() - started, route=route)
+        metrics.inc('http_requests_total', route=route,
+                    method=request.method, status=response.status_code)
+    return response
+
+
+# =============================================================================
+# LAZY BACKENDS
+# =============================================================================
+# Nothing talks to Google at import time: each connection is made on first
+# use and warmed by a background thread, so a cold worker serves / and static
+# files immediately. /ready reports when the backends are connected.
+
+
+class LazyBackend:
+    """
+    Stands in for an object that is slow to create (a login, an opened
+    spreadsheet). The first attribute access connects; a failed connect is
+    raised to that caller and retried on the next access.
+    """
+
+    def __init__(self, name, connect):
+        self._name = name
+        self._connect = connect
+        self._value = None
+        self._lock = threading.Lock()
+        self.error = None
+        self.connected_at = None
+        self.connect_seconds = None
+
+    def get(self):
+        value = self._value
+        if value is None:
+            with self._lock:
+                if self._value is None:
+                    started = perf_counter()
+                    try:
+                        self._value = self._connect()
+                    except Exception as e:
+                        self.error = str(e)
+                        raise
+                    self.error = None
+                    self.connected_at = datetime.now().isoformat()
+                    self.connect_seconds = round(perf_counter() - started, 3)
+                value = self._value
+        return value
+
+    @property
+    def ready(self):
+        return self._value is not None
+
+    def status(self):
+        return {'ready': self.ready, 'connected_at': self.connected_at,
+                'connect_seconds': self.connect_seconds, 'error': self.error}
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def __repr__(self):
+        return f"<LazyBackend {self._name} {'ready' if self.ready else 'pending'}>"
 
 
 # Google Sheets Setup
 SCOPE = ["https://spreadsheets.google.com/feeds",
          "https://www.googleapis.com/auth/drive"]
 
-# Handle credentials from environment or file
-google_creds = os.environ.get('GOOGLE_CREDENTIALS')
-if google_creds:
-    # Production: use environment variable
-    import tempfile
-    with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json') as f:
-        f.write(google_creds)
-        creds_file = f.name
-    CREDENTIALS = ServiceAccountCredentials.from_json_keyfile_name(
-        creds_file, SCOPE)
-    def cleanup_creds():
-        try:
-            os.unlink(creds_file)
-        except OSError:
-            pass
-    atexit.register(cleanup_creds)
-else:
-    # Development: use local file
-    CREDENTIALS = ServiceAccountCredentials.from_json_keyfile_name(
-        "jiulongding-9e2cffe41bca.json", SCOPE)
 
-gc = gspread.authorize(CREDENTIALS)
+def _connect_google():
+    """Authorize gspread from GOOGLE_CREDENTIALS, or the local key file in development"""
+    google_creds = os.environ.get('GOOGLE_CREDENTIALS')
+    if google_creds:
+        credentials = ServiceAccountCredentials.from_json_keyfile_dict(
+            json.loads(google_creds), SCOPE)
+    else:
+        credentials = ServiceAccountCredentials.from_json_keyfile_name(
+            "jiulongding-9e2cffe41bca.json", SCOPE)
+    client = gspread.authorize(credentials)
+    client.set_timeout(SHEETS_TIMEOUT)
+    return client
+
+
+gc = LazyBackend('google', _connect_google)
+
+# =============================================================================
+# GOOGLE SHEETS CLIENT (quota-aware)
+# =============================================================================
+
+# Google allows 60 read and 60 write requests per minute per user; with
+# several gunicorn workers, divide these between them
+SHEETS_READS_PER_MINUTE = float(os.environ.get('SHEETS_READS_PER_MINUTE', 60))
+SHEETS_WRITES_PER_MINUTE = float(os.environ.get('SHEETS_WRITES_PER_MINUTE', 60))
+SHEETS_MAX_RETRIES = int(os.environ.get('SHEETS_MAX_RETRIES', 5))
+SHEETS_BACKOFF_BASE = float(os.environ.get('SHEETS_BACKOFF_BASE', 1))
+SHEETS_BACKOFF_CAP = float(os.environ.get('SHEETS_BACKOFF_CAP', 32))
+# Longest a call queues for a token before it is sent anyway
+SHEETS_MAX_QUEUE_WAIT = float(os.environ.get('SHEETS_MAX_QUEUE_WAIT', 30))
+SHEETS_TIMEOUT = (float(os.environ.get('SHEETS_CONNECT_TIMEOUT', 5)),
+                  float(os.environ.get('SHEETS_READ_TIMEOUT', 30)))
+
+SHEETS_READ_METHODS = {
+    'open', 'worksheet', 'worksheets', 'get_worksheet', 'fetch_sheet_metadata',
+    'values_batch_get', 'values_get', 'get_all_values', 'get_all_records',
+    'get_values', 'get', 'batch_get', 'row_values', 'col_values', 'find',
+    'findall', 'cell', 'acell',
+}
+SHEETS_WRITE_METHODS = {
+    'add_worksheet', 'del_worksheet', 'duplicate_sheet', 'batch_update',
+    'values_batch_update', 'values_update', 'values_append', 'append_row',
+    'append_rows', 'update', 'update_cell', 'update_cells', 'format',
+    'batch_format', 'batch_clear', 'clear', 'delete_rows', 'resize',
+}
+# Writes that would duplicate data if an attempt that reached Google is resent.
+# structure_update is Spreadsheet.batch_update: its insert/delete requests shift
+# rows, so resending one that landed applies it twice (Worksheet.batch_update
+# only writes values and is safe to resend).
+SHEETS_NON_IDEMPOTENT = {
+    'add_worksheet', 'duplicate_sheet', 'values_append', 'append_row',
+    'append_rows', 'delete_rows', 'structure_update',
+}
+# Calls whose result is a worksheet (or list of them) to wrap in turn
+SHEETS_HANDLE_METHODS = {
+    'open', 'worksheet', 'worksheets', 'get_worksheet', 'add_worksheet',
+    'duplicate_sheet',
+}
+
+
+class TokenBucket:
+    """Refills `rate_per_minute` tokens a minute, holding at most `capacity`"""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or max(1.0, rate_per_minute / 6)
+        self._tokens = self.capacity
+        self._updated = monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait):
+        """Take a token, sleeping until one is free (at most `max_wait` seconds)"""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now; a negative balance queues later callers
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            sleep(min(wait, max_wait))
+        return wait
+
+    def try_acquire(self):
+        """Take a token if one is free; returns 0, else seconds until one will be"""
+        with self._lock:
+            now = monotonic()
+            self._tokens = min(self.capacity,
+                               self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+
+def sheets_write_may_have_landed(error):
+    """Whether a failed Sheets call may still have been applied (a 500/502/504, or a timeout after connecting)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return False
+    if isinstance(error, gspread.exceptions.APIError):
+        return error.response.status_code in (500, 502, 504)
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+
+class SheetsClient:
+    """
+    Every Google Sheets call goes through here: a token bucket per lane (read
+    and write) paces requests to the quota, and 429/5xx responses or network
+    errors are retried with exponential backoff and full jitter.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.lanes = {
+            'read': TokenBucket(SHEETS_READS_PER_MINUTE),
+            'write': TokenBucket(SHEETS_WRITES_PER_MINUTE),
+        }
+
+    def open(self, title):
+        return self.call('read', 'open', self._client.open, title)
+
+    def _should_retry(self, method, error):
+        if isinstance(error, requests.exceptions.ConnectTimeout):
+            return True  # never reached Google
+        if (isinstance(error, gspread.exceptions.APIError)
+                and error.response.status_code in (429, 503)):
+            return True
+        return method not in SHEETS_NON_IDEMPOTENT and sheets_write_may_have_landed(error)
+
+    def call(self, lane, method, fn, *args, **kwargs):
+        for attempt in range(SHEETS_MAX_RETRIES + 1):
+            waited = self.lanes[lane].acquire(SHEETS_MAX_QUEUE_WAIT)
+            metrics.observe('sheets_quota_wait_seconds', waited, lane=lane)
+            try:
+                with track_outbound(f'sheets_{lane}', method) as outcome:
+                    try:
+                        result = fn(*args, **kwargs)
+                    except gspread.WorksheetNotFound:
+                        outcome['outcome'] = 'not_found'
+                        raise
+            except Exception as e:
+                if attempt == SHEETS_MAX_RETRIES or not self._should_retry(method, e):
+                    raise
+                delay = random.uniform(
+                    0, min(SHEETS_BACKOFF_CAP, SHEETS_BACKOFF_BASE * 2 ** attempt))
+                print(f"Sheets {method} failed ({e}), retry {attempt + 1} in {delay:.1f}s")
+                sleep(delay)
+                continue
+
+            if method in SHEETS_HANDLE_METHODS:
+                if isinstance(result, list):
+                    return [SheetsProxy(r, self) for r in result]
+                return SheetsProxy(result, self, is_spreadsheet=method == 'open')
+            return result
+
+
+class SheetsProxy:
+    """Spreadsheet/Worksheet wrapper routing API methods through a SheetsClient"""
+
+    def __init__(self, target, client, is_spreadsheet=False):
+        self._target = target
+        self._client = client
+        self._is_spreadsheet = is_spreadsheet
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        if name in SHEETS_READ_METHODS:
+            lane = 'read'
+        elif name in SHEETS_WRITE_METHODS:
+            lane = 'write'
+        else:
+            return attr
+        method = 'structure_update' if self._is_spreadsheet and name == 'batch_update' else name
+
+        def call(*args, **kwargs):
+            return self._client.call(lane, method, attr, *args, **kwargs)
+        return call
+
+    def __repr__(self):
+        return f"<SheetsProxy {self._target!r}>"
+
+
+sheets_client = SheetsClient(gc)
 
 # SMS API setup
 API_URL = "https://api.mobilemessage.com.au/v1/messages"
@@ -65,34 +538,183 @@ API_PASSWORD = os.environ.get('API_PASSWORD')
 auth_string = f"{API_USERNAME}:{API_PASSWORD}"
 AUTH_HEADER = base64.b64encode(auth_string.encode()).decode()
 
-# Connect to Google Sheets
-try:
-    spreadsheet = gc.open("Restaurant Reservations")
-    sheet = spreadsheet.worksheet('Master Data')
-    print(f"Successfully connected to sheet: {sheet.title}")
-except gspread.exceptions.WorksheetNotFound:
-    print("Error: 'Master Data' worksheet not found")
-    spreadsheet = gc.open("Restaurant Reservations")
-    for ws in spreadsheet.worksheets():
-        print(f"  - {ws.title}")
-    sheet = spreadsheet.get_worksheet(0)
-    print(f"Using first sheet as fallback: {sheet.title}")
-except Exception as e:
-    print(f"Error connecting to Google Sheets: {e}")
+RESEND_API_URL = "https://api.resend.com/emails"
 
 # =============================================================================
-# BACKGROUND FUNCTIONS FOR SCHEDULER
+# HTTP CLIENTS
 # =============================================================================
 
+# (connect, read) timeouts for outbound provider calls
+HTTP_TIMEOUT = (float(os.environ.get('HTTP_CONNECT_TIMEOUT', 3.05)),
+                float(os.environ.get('HTTP_READ_TIMEOUT', 10)))
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', 10))
 
-def send_today_confirmations_background():
-    """Background job for day-of SMS reminders"""
-    with app.app_context():
-        today = datetime.now(sydney_tz).strftime('%Y-%m-%d')
-        result = send_sms_on_date(today, message_type="day_of")
-        print(f"Automatic day-of SMS job completed: {result}")
+
+def make_http_session(retry_statuses, retries=3, backoff=0.5):
+    """
+    Keep-alive session with a sized connection pool that retries the given
+    status codes (and connection errors) with exponential backoff.
+    """
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,  # a timed-out POST may already have been delivered
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=retry_statuses,
+        allowed_methods=None,  # also retry POST
+        respect_retry_after_header=True,
+        raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_SIZE,
+                          max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+# Only statuses that mean the request was refused are retried for SMS: after
+# a 500, 502 or 504 a whole batch may have gone out, and resending would
+# text it twice. SMS runs mark those messages 'uncertain' and don't resend them.
+sms_http = make_http_session([429, 503])
+# No status retries for Resend: the email worker already retries 429s and 5xx
+# with backoff (EMAIL_MAX_ATTEMPTS), and /test-email sends no Idempotency-Key.
+# Connection errors, which never reached Resend, are still retried here.
+email_http = make_http_session([])
+ping_http = make_http_session([502, 503, 504], retries=1)
+
+
+
+def _open_master_sheet():
+    try:
+        master = spreadsheet.worksheet('Master Data')
+        print(f"Successfully connected to sheet: {master.title}")
+    except gspread.exceptions.WorksheetNotFound:
+        print("Error: 'Master Data' worksheet not found")
+        for ws in spreadsheet.worksheets():
+            print(f"  - {ws.title}")
+        master = spreadsheet.get_worksheet(0)
+        print(f"Using first sheet as fallback: {master.title}")
+    return master
+
+
+# Connect to Google Sheets on first use
+spreadsheet = LazyBackend('spreadsheet', lambda: sheets_client.open("Restaurant Reservations"))
+sheet = LazyBackend('master_sheet', _open_master_sheet)
+
+# =============================================================================
+# WORKSHEET REGISTRY
+# =============================================================================
+
+# Minimum seconds between metadata refreshes triggered by a missing title
+WORKSHEET_REFRESH_INTERVAL = int(
+    os.environ.get('WORKSHEET_REFRESH_INTERVAL', 10))
+
+_worksheets = {}
+_worksheets_loaded_at = None
+_worksheets_lock = threading.Lock()
+
+
+def _refresh_worksheets():
+    """Reload every worksheet handle with a single metadata fetch"""
+    global _worksheets, _worksheets_loaded_at
+    _worksheets = {ws.title: ws for ws in spreadsheet.worksheets()}
+    _worksheets_loaded_at = monotonic()
+
+
+def get_worksheet(title):
+    """
+    Return the Worksheet for `title` from the registry.
+    The registry is loaded on first use and refreshed lazily when a title is
+    missing; raises gspread.WorksheetNotFound if it still doesn't exist.
+    """
+    with _worksheets_lock:
+        if _worksheets_loaded_at is None:
+            _refresh_worksheets()
+
+        ws = _worksheets.get(title)
+        if ws is None and monotonic() - _worksheets_loaded_at >= WORKSHEET_REFRESH_INTERVAL:
+            _refresh_worksheets()
+            ws = _worksheets.get(title)
+
+    if ws is None:
+        raise gspread.WorksheetNotFound(title)
+    return ws
+
+
+def worksheet_titles(expected=()):
+    """
+    Titles currently in the registry (loads it on first use).
+    If any `expected` title is missing, the registry is refreshed first,
+    subject to WORKSHEET_REFRESH_INTERVAL.
+    """
+    with _worksheets_lock:
+        if _worksheets_loaded_at is None:
+            _refresh_worksheets()
+        elif (any(t not in _worksheets for t in expected)
+              and monotonic() - _worksheets_loaded_at >= WORKSHEET_REFRESH_INTERVAL):
+            _refresh_worksheets()
+        return set(_worksheets)
 
 
+def add_worksheet(title, rows, cols):
+    """Create a worksheet and register its handle"""
+    try:
+        ws = spreadsheet.add_worksheet(title=title, rows=rows, cols=cols)
+    except gspread.exceptions.APIError:
+        # Another worker may have created it since our registry was loaded
+        with _worksheets_lock:
+            _refresh_worksheets()
+            if title in _worksheets:
+                return _worksheets[title]
+        raise
+    with _worksheets_lock:
+        _worksheets[title] = ws
+    return ws
+
+# =============================================================================
+# BACKGROUND FUNCTIONS FOR SCHEDULER
+# =============================================================================
+
+
+@timed_job('reservation_reminder')
+def send_reservation_reminder(sheet_name, reservation_id):
+    """Reminder job for one booking; does nothing once it has replied or been texted"""
+    with try_process_lock('sms_run') as acquired:
+        if acquired:
+            result = _run_sms_reminders(sheet_name, 'day_of', reservation_ids={reservation_id})
+            print(f"Reminder for reservation {reservation_id}: {result}")
+            return
+
+    # A manual run for the day is sending; try again once it has finished
+    scheduler.add_job(
+        send_reservation_reminder,
+        trigger=DateTrigger(run_date=datetime.now(sydney_tz) + timedelta(seconds=REMINDER_RETRY_DELAY)),
+        args=[sheet_name, reservation_id],
+        name=f'Reminder {reservation_id} (retry)',
+        jobstore='reminders')
+
+
+@timed_job('reconcile_reservations')
+def reconcile_reservations_background():
+    """Pick up rows staff typed into or edited on upcoming date tabs"""
+    with try_process_lock('journal') as acquired:
+        if not acquired:
+            return  # The flusher is writing; try again next run
+        changed = reservation_store.reconcile(upcoming_dates())
+    if changed:
+        print(f"Reconciled {len(changed)} date tab(s) edited in Sheets: {', '.join(changed)}")
+        schedule_upcoming_reminders()
+
+
+@timed_job('schedule_reminders')
+def schedule_reminders_background():
+    """Add missing reminder jobs, and send today's reminders that never went out"""
+    print(f"Reminder backfill: {schedule_upcoming_reminders()} job(s) added")
+    print(f"Overdue reminders: {send_overdue_reminders()}")
+
+
+@timed_job('day_before_sms')
 def send_tomorrow_confirmations_background():
     """Background job for day-before SMS reminders"""
     with app.app_context():
@@ -101,11 +723,30 @@ def send_tomorrow_confirmations_background():
         print(f"Automatic day-before SMS job completed: {result}")
 
 
+@timed_job('provision_date_sheets')
+def provision_date_sheets_background():
+    """Create the coming days' date tabs so bookings only ever append"""
+    today = datetime.now(sydney_tz).date()
+    titles = [(today + timedelta(days=i)).strftime('%Y-%m-%d')
+              for i in range(PROVISION_DAYS + 1)]
+    created = create_date_sheets(titles)
+    print(f"Date sheet provisioning: {len(created)} created, "
+          f"{len(titles) - len(created)} already present")
+
+
+@timed_job('archive')
+def archive_old_reservations_background():
+    """Move old date tabs and Master Data rows out of the spreadsheet"""
+    archive_old_reservations()
+
+
+@timed_job('keep_alive')
 def keep_alive_ping():
     """Ping self every 10 minutes to prevent spin-down"""
     try:
         render_url = os.environ.get('RENDER_URL', 'https://jiulongding.onrender.com')
-        requests.get(f'{render_url}/test', timeout=5)
+        with track_outbound('self', 'keep_alive'):
+            ping_http.get(f'{render_url}/test', timeout=(3.05, 5))
         print("✓ Keep-alive ping sent")
     except Exception as e:
         print(f"Keep-alive ping failed: {e}")
@@ -115,10 +756,118 @@ def keep_alive_ping():
 # SCHEDULER SETUP
 # =============================================================================
 
+class StateJobStore(BaseJobStore):
+    """
+    APScheduler job store kept in state.db, along the lines of APScheduler's
+    SQLAlchemyJobStore. Jobs survive restarts, and any worker on the host can
+    add jobs for the scheduler leader to run.
+    """
+
+    def __init__(self, table='scheduled_jobs', pickle_protocol=pickle.HIGHEST_PROTOCOL):
+        super().__init__()
+        self.table = table
+        self.pickle_protocol = pickle_protocol
+
+    def start(self, scheduler, alias):
+        super().start(scheduler, alias)
+        with closing(state_db()) as conn, conn:
+            conn.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.table} (
+                    id TEXT PRIMARY KEY,
+                    next_run_time REAL,
+                    job_state BLOB NOT NULL
+                )
+            """)
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_next_run_time "
+                         f"ON {self.table} (next_run_time)")
+
+    def lookup_job(self, job_id):
+        with closing(state_db()) as conn:
+            row = conn.execute(f"SELECT job_state FROM {self.table} WHERE id = ?",
+                               (job_id,)).fetchone()
+        return self._reconstitute_job(row[0]) if row else None
+
+    def get_due_jobs(self, now):
+        return self._get_jobs("next_run_time <= ?", (datetime_to_utc_timestamp(now),))
+
+    def get_next_run_time(self):
+        with closing(state_db()) as conn:
+            (timestamp,) = conn.execute(f"SELECT MIN(next_run_time) FROM {self.table}").fetchone()
+        return utc_timestamp_to_datetime(timestamp)
+
+    def get_all_jobs(self):
+        jobs = self._get_jobs()
+        self._fix_paused_jobs_sorting(jobs)
+        return jobs
+
+    def add_job(self, job):
+        try:
+            with closing(state_db()) as conn, conn:
+                conn.execute(
+                    f"INSERT INTO {self.table} (id, next_run_time, job_state) VALUES (?, ?, ?)",
+                    (job.id, datetime_to_utc_timestamp(job.next_run_time),
+                     pickle.dumps(job.__getstate__(), self.pickle_protocol)))
+        except sqlite3.IntegrityError:
+            raise ConflictingIdError(job.id)
+
+    def update_job(self, job):
+        with closing(state_db()) as conn, conn:
+            updated = conn.execute(
+                f"UPDATE {self.table} SET next_run_time = ?, job_state = ? WHERE id = ?",
+                (datetime_to_utc_timestamp(job.next_run_time),
+                 pickle.dumps(job.__getstate__(), self.pickle_protocol), job.id)).rowcount
+        if not updated:
+            raise JobLookupError(job.id)
+
+    def remove_job(self, job_id):
+        with closing(state_db()) as conn, conn:
+            removed = conn.execute(f"DELETE FROM {self.table} WHERE id = ?", (job_id,)).rowcount
+        if not removed:
+            raise JobLookupError(job_id)
+
+    def remove_all_jobs(self):
+        with closing(state_db()) as conn, conn:
+            conn.execute(f"DELETE FROM {self.table}")
+
+    def _reconstitute_job(self, job_state):
+        job_state = pickle.loads(job_state)
+        job_state['jobstore'] = self
+        job = Job.__new__(Job)
+        job.__setstate__(job_state)
+        job._scheduler = self._scheduler
+        job._jobstore_alias = self._alias
+        return job
+
+    def _get_jobs(self, condition='1', params=()):
+        with closing(state_db()) as conn:
+            rows = conn.execute(
+                f"SELECT id, job_state FROM {self.table} WHERE {condition} ORDER BY next_run_time",
+                params).fetchall()
+
+        jobs = []
+        failed = []
+        for job_id, job_state in rows:
+            try:
+                jobs.append(self._reconstitute_job(job_state))
+            except BaseException:
+                self._logger.exception('Unable to restore job "%s" -- removing it', job_id)
+                failed.append(job_id)
+
+        if failed:
+            with closing(state_db()) as conn, conn:
+                conn.executemany(f"DELETE FROM {self.table} WHERE id = ?", [(i,) for i in failed])
+        return jobs
+
+    def __repr__(self):
+        return f'<{self.__class__.__name__} (table={self.table})>'
+
+
 sydney_tz = timezone('Australia/Sydney')
 scheduler = BackgroundScheduler(
     timezone=sydney_tz,
     daemon=False,  # ← Important: don't let it be a daemon
+    # Recurring jobs are re-added on every start; per-booking reminders persist
+    jobstores={'reminders': StateJobStore()},
     job_defaults={
         'coalesce': True,      # Skip missed jobs
         'max_instances': 1,    # Never run multiple copies
@@ -134,12 +883,42 @@ scheduler = BackgroundScheduler(
 #     id='day_before_sms'
 # )›››
 
-# Day-of reminders at 8:30AM
+# Day-of reminders go out REMINDER_HOURS_BEFORE each booking, from a job
+# added when it is made. This sweep adds jobs for bookings that predate
+# theirs and sends any of today's reminders that a late or dropped job missed.
+REMINDER_SWEEP_MINUTES = int(os.environ.get('REMINDER_SWEEP_MINUTES', 15))
+scheduler.add_job(
+    func=schedule_reminders_background,
+    trigger=CronTrigger(minute=f'*/{REMINDER_SWEEP_MINUTES}', timezone=sydney_tz),
+    id='schedule_reminders',
+    name='Schedule Reservation Reminders',
+    replace_existing=True
+)
+
+# Date tabs for the next PROVISION_DAYS days; also run once warm-up has connected
+scheduler.add_job(
+    func=provision_date_sheets_background,
+    trigger=CronTrigger(hour=0, minute=15, timezone=sydney_tz),
+    id='provision_date_sheets',
+    name='Provision Date Sheets',
+    replace_existing=True
+)
+
+# Rows typed into the date tabs by hand reach the reservation store
+RESERVATION_RECONCILE_MINUTES = int(os.environ.get('RESERVATION_RECONCILE_MINUTES', 5))
+scheduler.add_job(
+    func=reconcile_reservations_background,
+    trigger=CronTrigger(minute=f'*/{RESERVATION_RECONCILE_MINUTES}', timezone=sydney_tz),
+    id='reconcile_reservations',
+    name='Reconcile Reservations',
+    replace_existing=True
+)
+
 scheduler.add_job(
-    func=send_today_confirmations_background,
-    trigger=CronTrigger(hour=8, minute=30, timezone=sydney_tz),
-    id='send_today_sms',
-    name='Send Today SMS',
+    func=archive_old_reservations_background,
+    trigger=CronTrigger(hour=3, minute=0, timezone=sydney_tz),
+    id='archive',
+    name='Archive Old Reservations',
     replace_existing=True
 )
 
@@ -152,15 +931,225 @@ scheduler.add_job(
 )
 
 
+# Only one process on the host runs the scheduler: the one holding the
+# 'scheduler' lease. The others poll for it and take over if the leader dies.
+# Every process starts the scheduler paused so it can add reminder jobs to the
+# shared job store; the leader resumes it and is the only one to run jobs.
+SCHEDULER_LEADER_POLL = float(os.environ.get('SCHEDULER_LEADER_POLL', 15))
+_scheduler_lease = None
+
 try:
-    scheduler.start()
-    logger.info("✅ Scheduler started successfully")
-    for job in scheduler.get_jobs():
-        logger.info(f"   Job: {job.id} - Next run: {job.next_run_time}")
+    scheduler.start(paused=True)
 except Exception as e:
     logger.error(f"❌ Scheduler failed to start: {e}", exc_info=True)
 
-atexit.register(lambda: scheduler.shutdown())
+
+def start_scheduler_if_leader():
+    """Resume the scheduler if this process can take the lease; True if leader"""
+    global _scheduler_lease
+    if _scheduler_lease is not None:
+        return True
+    lease = try_acquire_lease('scheduler')
+    if lease is None:
+        return False
+
+    _scheduler_lease = lease
+    try:
+        scheduler.resume()
+        logger.info(f"✅ Scheduler started successfully (leader pid {os.getpid()})")
+        for job in scheduler.get_jobs():
+            logger.info(f"   Job: {job.id} - Next run: {job.next_run_time}")
+    except Exception as e:
+        logger.error(f"❌ Scheduler failed to start: {e}", exc_info=True)
+    return True
+
+
+def scheduler_active():
+    """True if this process is the leader and its scheduler is running jobs"""
+    return _scheduler_lease is not None and scheduler.state == STATE_RUNNING
+
+
+def _scheduler_election():
+    while not start_scheduler_if_leader():
+        sleep(SCHEDULER_LEADER_POLL)
+
+
+if not start_scheduler_if_leader():
+    threading.Thread(target=_scheduler_election, name='scheduler-election', daemon=True).start()
+
+
+def _shutdown_scheduler():
+    if scheduler.running:
+        scheduler.shutdown()
+
+
+atexit.register(_shutdown_scheduler)
+
+# =============================================================================
+# RESERVATION CACHE
+# =============================================================================
+
+RESERVATION_CACHE_TTL = int(os.environ.get('RESERVATION_CACHE_TTL', 30))
+RESERVATION_CACHE_SIZE = int(os.environ.get('RESERVATION_CACHE_SIZE', 64))
+
+
+class ReservationCache:
+    """
+    Per-date cache of parsed reservation rows, keyed by sheet name.
+    Entries expire after `ttl` seconds and the least recently used date is
+    evicted once `max_size` dates are held.
+    """
+
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, sheet_name):
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if entry is None:
+                return None
+            loaded_at, reservations = entry
+            if monotonic() - loaded_at > self.ttl:
+                del self._entries[sheet_name]
+                return None
+            self._entries.move_to_end(sheet_name)
+            return [dict(r) for r in reservations]
+
+    def set(self, sheet_name, reservations):
+        with self._lock:
+            self._entries[sheet_name] = (
+                monotonic(), [dict(r) for r in reservations])
+            self._entries.move_to_end(sheet_name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def append(self, sheet_name, reservation):
+        """Add a newly written row to a cached date (no-op if not cached)"""
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if entry is None:
+                return
+            if any(r['row_number'] == reservation['row_number'] for r in entry[1]):
+                return
+            entry[1].append(dict(reservation))
+
+    def update_row(self, sheet_name, row_number, **fields):
+        """Patch a cached row in place; drops the date if the row is unknown"""
+        with self._lock:
+            entry = self._entries.get(sheet_name)
+            if entry is None:
+                return
+            for reservation in entry[1]:
+                if reservation['row_number'] == row_number:
+                    reservation.update(fields)
+                    return
+            del self._entries[sheet_name]
+
+    def invalidate(self, sheet_name):
+        with self._lock:
+            self._entries.pop(sheet_name, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+reservation_cache = ReservationCache(
+    RESERVATION_CACHE_TTL, RESERVATION_CACHE_SIZE)
+
+# =============================================================================
+# PHONE INDEX (inbound SMS matching)
+# =============================================================================
+
+PHONE_INDEX_PAST_DAYS = int(os.environ.get('PHONE_INDEX_PAST_DAYS', 1))
+PHONE_INDEX_FUTURE_DAYS = int(os.environ.get('PHONE_INDEX_FUTURE_DAYS', 35))
+
+
+class PhoneIndex:
+    """
+    Maps a cleaned phone number to the reservations it holds in the upcoming
+    window: {phone: {(sheet_name, row_number): name}}.
+    Filled as date sheets are written or read; never queries Sheets itself.
+    """
+
+    def __init__(self, past_days, future_days):
+        self.past_days = past_days
+        self.future_days = future_days
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def window(self):
+        today = datetime.now(sydney_tz).date()
+        return (today - timedelta(days=self.past_days),
+                today + timedelta(days=self.future_days))
+
+    def _in_window(self, sheet_name):
+        try:
+            day = datetime.strptime(sheet_name, '%Y-%m-%d').date()
+        except ValueError:
+            return False
+        start, end = self.window()
+        return start <= day <= end
+
+    def add(self, sheet_name, reservation):
+        phone = clean_phone(reservation.get('phone'))
+        if not phone or not self._in_window(sheet_name):
+            return
+        with self._lock:
+            self._entries.setdefault(phone, {})[
+                (sheet_name, reservation['row_number'])] = reservation.get('name', '')
+
+    def add_many(self, sheet_name, reservations):
+        if not self._in_window(sheet_name):
+            return
+        for reservation in reservations:
+            self.add(sheet_name, reservation)
+
+    def lookup(self, phone, reply_date):
+        """
+        Best (sheet_name, row_number, name) for a reply sent on reply_date:
+        the earliest booking on or after that date, else the most recent one
+        before it (a reply sent after midnight). None if the phone is unknown.
+        """
+        phone = clean_phone(phone)
+        with self._lock:
+            entries = dict(self._entries.get(phone, {}))
+        if not entries:
+            return None
+
+        start, _ = self.window()
+        start = start.strftime('%Y-%m-%d')
+        keys = sorted(k for k in entries if k[0] >= start)
+        upcoming = [k for k in keys if k[0] >= reply_date]
+        if upcoming:
+            key = upcoming[0]
+        elif keys:
+            key = keys[-1]
+        else:
+            return None
+        return key[0], key[1], entries[key]
+
+    def prune(self):
+        """Drop dates that have fallen out of the window"""
+        start, _ = self.window()
+        start = start.strftime('%Y-%m-%d')
+        with self._lock:
+            for phone in list(self._entries):
+                rows = {k: v for k, v in self._entries[phone].items() if k[0] >= start}
+                if rows:
+                    self._entries[phone] = rows
+                else:
+                    del self._entries[phone]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(rows) for rows in self._entries.values())
+
+
+phone_index = PhoneIndex(PHONE_INDEX_PAST_DAYS, PHONE_INDEX_FUTURE_DAYS)
 
 # =============================================================================
 # HELPER FUNCTIONS
@@ -171,15 +1160,53 @@ def is_logged_in():
     return session.get('staff_authenticated') == True
 
 
-def generate_reservation_id():
-    """Generate sequential ID by counting existing reservations"""
-    all_data = sheet.get_all_values()
-    existing_reservations = len(all_data) - 1  # Subtract header row
+RESERVATION_ID_FILE = os.path.join(STATE_DIR, 'reservation_id')
+
+
+def _seed_reservation_id():
+    """Highest ID in Master Data or the archive, read once when no counter exists"""
+    ids = sheet.col_values(1)[1:]  # Skip header row
+    numeric_ids = [int(i) for i in ids if str(i).isdigit()]
+    archived = read_archive_index()['max_reservation_id']
+    return max(numeric_ids + [len(ids), archived])
+
+
+def _read_reservation_counter():
+    try:
+        with open(RESERVATION_ID_FILE) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
 
-    if existing_reservations < 0:
-        existing_reservations = 0
+def _write_reservation_counter(value):
+    tmp_path = RESERVATION_ID_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(str(value))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, RESERVATION_ID_FILE)
 
-    return existing_reservations + 1
+
+def generate_reservation_id():
+    """
+    Allocate the next sequential ID from a locally persisted counter.
+    An exclusive file lock serialises allocation across gunicorn workers and
+    the counter is replaced atomically, so a crash can skip an ID but never
+    hand the same one out twice.
+    """
+    with open(RESERVATION_ID_FILE + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            last_id = _read_reservation_counter()
+            if last_id is None:
+                last_id = _seed_reservation_id()
+            next_id = last_id + 1
+            _write_reservation_counter(next_id)
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    return next_id
 
 
 def clean_phone(phone):
@@ -212,224 +1239,2657 @@ def clean_phone(phone):
     return number
 
 
-def send_confirmation_email(customer_email, customer_name, reservation_details):
-    """send confirmation email with reservation summary"""
+def parse_reservation_row(row, row_number):
+    """Turn one date sheet row into the reservation dict used by the dashboard"""
+    return {
+        'row_number': row_number,
+        'name': row[0] if len(row) > 0 else '',
+        'time': row[1] if len(row) > 1 else '',
+        'people': row[2] if len(row) > 2 else '',
+        'phone': row[3] if len(row) > 3 else '',
+        'email': row[4] if len(row) > 4 else '',
+        'date': row[5] if len(row) > 5 else '',
+        'dish_type': row[6] if len(row) > 6 else '',
+        'notes': row[7] if len(row) > 7 else '',
+        'confirmed': row[8] if len(row) > 8 else 'Pending',
+        'reservation_id': row[9] if len(row) > 9 else '',
+        'sms_reply': row[10] if len(row) > 10 else '',
+        'confirmation_method': row[11] if len(row) > 11 else ''
+    }
+
+
+def load_date_reservations(sheet_name):
+    """
+    Return parsed reservations for a date sheet, served from the cache when fresh.
+    A missing sheet is cached as an empty list.
+    """
+    reservations = reservation_cache.get(sheet_name)
+    if reservations is not None:
+        return reservations
+
+    try:
+        date_sheet = get_worksheet(sheet_name)
+        all_data = date_sheet.get_all_values()
+    except gspread.WorksheetNotFound:
+        all_data = []
+
+    reservations = [parse_reservation_row(row, i)
+                    for i, row in enumerate(all_data[1:], start=2)
+                    if len(row) >= 9]
+    reservation_cache.set(sheet_name, reservations)
+    phone_index.add_many(sheet_name, reservations)
+    return reservations
+
+
+def fetch_date_tabs(titles):
+    """Read several existing date tabs with a single values_batch_get call"""
+    if not titles:
+        return {}
+    response = spreadsheet.values_batch_get([f"'{t}'!A:L" for t in titles])
+
+    loaded = {}
+    for title, value_range in zip(titles, response.get('valueRanges', [])):
+        rows = value_range.get('values', [])
+        loaded[title] = [parse_reservation_row(row, i)
+                         for i, row in enumerate(rows[1:], start=2)
+                         if len(row) >= 9]
+    return loaded
+
+
+def read_date_sheets(titles):
+    """
+    fetch_date_tabs() that also refreshes the cache and phone index.
+    Returns {title: reservations}.
+    """
+    loaded = fetch_date_tabs(titles)
+    for title, reservations in loaded.items():
+        reservation_cache.set(title, reservations)
+        phone_index.add_many(title, reservations)
+    return loaded
+
+
+def load_reservations_for_dates(sheet_names):
+    """
+    Reservations for many dates: cached dates come from memory, the rest are
+    fetched together in one batched read. Missing tabs give empty lists.
+    """
+    result = {}
+    missing = []
+    for sheet_name in sheet_names:
+        cached = reservation_cache.get(sheet_name)
+        if cached is None:
+            missing.append(sheet_name)
+        else:
+            result[sheet_name] = cached
+
+    existing = worksheet_titles(expected=missing)
+    for sheet_name in missing:
+        if sheet_name not in existing:
+            reservation_cache.set(sheet_name, [])
+            result[sheet_name] = []
+
+    result.update(read_date_sheets([n for n in missing if n in existing]))
+    return result
+
+
+def reservation_sort_key(reservation):
+    """Sort reservations by time; unparseable times sort as midday"""
+    time_str = reservation['time']
+    for fmt in ('%H:%M', '%I:%M %p'):
+        try:
+            return datetime.strptime(time_str, fmt).time()
+        except ValueError:
+            pass
+    return datetime.strptime('12:00', '%H:%M').time()
+
+
+def reservation_totals(reservations):
+    """The summary counts shown on the dashboard"""
+    return {
+        'total_confirmed': len([r for r in reservations if r['confirmed'].lower() in ['confirmed', 'yes']]),
+        'total_pending': len([r for r in reservations if r['confirmed'].lower() in ['pending', 'no', '']]),
+        'total_people': sum([int(r['people']) for r in reservations if r['people'].isdigit()])
+    }
+
+
+def row_from_append(response):
+    """Extract the written row number from an append_row API response"""
+    try:
+        updated_range = response['updates']['updatedRange']
+        return int(re.search(r'![A-Z]+(\d+)', updated_range).group(1))
+    except (KeyError, TypeError, AttributeError, ValueError):
+        return None
+
+
+class TransientEmailError(Exception):
+    """Resend failure that is worth retrying later (network error, 429, 5xx)"""
+
+
+EMAIL_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def send_confirmation_email(customer_email, customer_name, reservation_details, raise_transient=False):
+    """
+    send confirmation email with reservation summary
+    With raise_transient=True, retryable failures raise TransientEmailError
+    instead of returning False.
+    """
+    try:
+        print(f"Attempting to send email to {customer_email}...")
+
+        try:
+            date_obj = datetime.strptime(reservation_details['date'], '%Y-%m-%d')
+            formatted_date = date_obj.strftime('%A, %B %d, %Y')
+        except:
+            formatted_date = reservation_details['date']
+
+        subject = f"Booking Summary - {formatted_date} at {reservation_details['time']}"
+
+        text_body = f"""Dear {customer_name},
+
+Thank you for choosing JiuLongDing Chongqing Hotpot!
+
+RESERVATION SUMMARY
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📅 Date: {formatted_date}
+🕐 Time: {reservation_details['time']}
+👥 People: {reservation_details['people']} people
+🍲 Dish Type: {reservation_details.get('dish_type', 'Not specified')}
+📞 Contact: {reservation_details['phone']}
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+🏢 RESTAURANT LOCATION
+JiuLongDing Chongqing Hotpot (九龙鼎重庆火锅)
+📍 71 Dixon Street (up the stairs)
+    Haymarket, Sydney NSW 2000
+📞 Phone: +61 423 987 048
+
+
+⚠️ IMPORTANT REMINDERS
+• Please arrive on time - we hold tables for 15 minutes
+• To cancel or make changes, please call us at +61 423 987 048 with your name and date of reservation
+
+Warm regards,
+The JiuLongDing Team
+九龙鼎重庆火锅
+
+---
+This is an automated reservation summary."""
+
+        headers = {"Authorization": f"Bearer {os.environ.get('RESEND_API_KEY')}"}
+        if reservation_details.get('reservation_id'):
+            headers["Idempotency-Key"] = f"reservation-{reservation_details['reservation_id']}"
+
+        with track_outbound('resend', 'confirmation_email') as call:
+            response = email_http.post(
+                RESEND_API_URL,
+                headers=headers,
+                json={
+                    "from": "JLD Hotpot <reservations@jiulongding.com.au>",
+                    "to": [customer_email],
+                    "subject": subject,
+                    "text": text_body
+                },
+                timeout=HTTP_TIMEOUT
+            )
+            if response.status_code != 200:
+                call['outcome'] = f'http_{response.status_code}'
+        if response.status_code != 200:
+            print(f"Resend error {response.status_code}: {response.text}")
+            if raise_transient and response.status_code in EMAIL_RETRY_STATUSES:
+                raise TransientEmailError(f"Resend returned {response.status_code}")
+            return False
+
+        print(
+            f"Confirmation email sent to {customer_email} )")
+        return True
+
+    except TransientEmailError:
+        raise
+    except requests.RequestException as e:
+        print(f"Error sending email to {customer_email}: {e}")
+        if raise_transient:
+            raise TransientEmailError(str(e)) from e
+        return False
+    except Exception as e:
+        print(f"Error sending email to {customer_email}: {e}")
+        import traceback
+        traceback.print_exc()
+        return False
+
+
+# =============================================================================
+# EMAIL WORKER POOL
+# =============================================================================
+
+EMAIL_WORKERS = int(os.environ.get('EMAIL_WORKERS', 2))
+EMAIL_QUEUE_SIZE = int(os.environ.get('EMAIL_QUEUE_SIZE', 100))
+EMAIL_MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 4))
+EMAIL_RETRY_BASE_DELAY = float(os.environ.get('EMAIL_RETRY_BASE_DELAY', 5))
+# How long a request waits for queue space before giving up on the email
+EMAIL_ENQUEUE_TIMEOUT = float(os.environ.get('EMAIL_ENQUEUE_TIMEOUT', 2))
+EMAIL_DRAIN_TIMEOUT = float(os.environ.get('EMAIL_DRAIN_TIMEOUT', 20))
+
+email_queue = queue.Queue(maxsize=EMAIL_QUEUE_SIZE)
+email_stats = {'sent': 0, 'failed': 0, 'retried': 0, 'dropped': 0, 'in_flight': 0}
+_email_stats_lock = threading.Lock()
+_email_workers = []
+
+
+def _count_email(key, delta=1):
+    with _email_stats_lock:
+        email_stats[key] += delta
+
+
+def send_email_async(email, name, reservation_data):
+    """
+    Queue a confirmation email for the worker pool.
+    Blocks briefly when the queue is full; returns False if it stays full.
+    """
+    try:
+        email_queue.put((email, name, reservation_data),
+                        timeout=EMAIL_ENQUEUE_TIMEOUT)
+        return True
+    except queue.Full:
+        _count_email('dropped')
+        print(f"❌ Email queue full, confirmation for {email} not sent")
+        return False
+
+
+def _email_worker():
+    """Send queued emails, retrying transient Resend failures with backoff"""
+    while True:
+        job = email_queue.get()
+        if job is None:
+            email_queue.task_done()
+            return
+
+        email, name, reservation_data = job
+        _count_email('in_flight')
+        try:
+            for attempt in range(1, EMAIL_MAX_ATTEMPTS + 1):
+                try:
+                    email_sent = send_confirmation_email(
+                        email, name, reservation_data, raise_transient=True)
+                except TransientEmailError as e:
+                    if attempt == EMAIL_MAX_ATTEMPTS:
+                        email_sent = False
+                        break
+                    delay = EMAIL_RETRY_BASE_DELAY * 2 ** (attempt - 1)
+                    print(f"Email to {email} failed ({e}), retrying in {delay:.0f}s")
+                    _count_email('retried')
+                    sleep(delay)
+                    continue
+                break
+
+            if email_sent:
+                _count_email('sent')
+                print(f"✅ Background email sent successfully to {email}")
+            else:
+                _count_email('failed')
+                print(f"❌ Background email failed for {email}")
+        except Exception as e:
+            _count_email('failed')
+            print(f"❌ Background email error: {str(e)}")
+        finally:
+            _count_email('in_flight', -1)
+            email_queue.task_done()
+
+
+def email_queue_status():
+    with _email_stats_lock:
+        return dict(email_stats, queued=email_queue.qsize(),
+                    workers=len(_email_workers))
+
+
+def start_email_workers():
+    for i in range(EMAIL_WORKERS):
+        worker = threading.Thread(
+            target=_email_worker, name=f'email-worker-{i}', daemon=True)
+        worker.start()
+        _email_workers.append(worker)
+
+
+def drain_email_queue():
+    """Let workers finish queued emails (up to EMAIL_DRAIN_TIMEOUT) on shutdown"""
+    for _ in _email_workers:
+        try:
+            email_queue.put(None, timeout=EMAIL_DRAIN_TIMEOUT)
+        except queue.Full:
+            break
+    deadline = monotonic() + EMAIL_DRAIN_TIMEOUT
+    for worker in _email_workers:
+        worker.join(max(0, deadline - monotonic()))
+    if email_queue.qsize():
+        print(f"⚠ {email_queue.qsize()} email(s) still queued at shutdown")
+
+
+start_email_workers()
+atexit.register(drain_email_queue)
+
+
+DATE_SHEET_HEADERS = ["Name", "Time", "People", "Phone", "Email",  "Date",
+                      "Dish Type", "Notes", "Confirmed", "Reservation ID", "SMS Reply", "Confirmation Method"]
+DATE_SHEET_ROWS = int(os.environ.get('DATE_SHEET_ROWS', 100))
+# The nightly job keeps tabs for today and this many days ahead in place
+PROVISION_DAYS = int(os.environ.get('PROVISION_DAYS', 14))
+
+
+def _date_sheet_requests(title):
+    """batchUpdate requests adding a sized date tab with its formatted header row"""
+    # Chosen here rather than by Sheets so the header request can refer to it
+    sheet_id = zlib.crc32(title.encode()) & 0x7fffffff
+    return [
+        {'addSheet': {'properties': {
+            'sheetId': sheet_id,
+            'title': title,
+            'gridProperties': {'rowCount': DATE_SHEET_ROWS, 'columnCount': len(DATE_SHEET_HEADERS)},
+        }}},
+        {'updateCells': {
+            'start': {'sheetId': sheet_id, 'rowIndex': 0, 'columnIndex': 0},
+            'rows': [{'values': [{
+                'userEnteredValue': {'stringValue': header},
+                'userEnteredFormat': {
+                    'textFormat': {'bold': True},
+                    'backgroundColor': {'red': 0.2, 'green': 0.6, 'blue': 0.9},
+                },
+            } for header in DATE_SHEET_HEADERS]}],
+            'fields': 'userEnteredValue,userEnteredFormat(textFormat,backgroundColor)',
+        }},
+    ]
+
+
+def create_date_sheets(titles):
+    """
+    Add the missing date tabs among `titles`, headers and formatting included,
+    with one batchUpdate. Returns the titles created.
+    """
+    for attempt in range(2):
+        existing = worksheet_titles(expected=titles)
+        missing = [t for t in dict.fromkeys(titles) if t not in existing]
+        if not missing:
+            return []
+        try:
+            spreadsheet.batch_update({'requests': [
+                r for title in missing for r in _date_sheet_requests(title)]})
+        except (gspread.exceptions.APIError, requests.exceptions.RequestException):
+            # Another worker may have added some of them since our registry was
+            # loaded, or a request that timed out (and isn't resent) may have landed
+            with _worksheets_lock:
+                _refresh_worksheets()
+            if attempt:
+                raise
+            continue
+
+        with _worksheets_lock:
+            _refresh_worksheets()
+        for title in missing:
+            reservation_cache.set(title, [])
+        return missing
+    return []
+
+
+def ensure_date_sheet(sheet_name):
+    """Return the sheet for a date, creating it with headers if needed"""
+    try:
+        return get_worksheet(sheet_name)
+    except gspread.WorksheetNotFound:
+        create_date_sheets([sheet_name])
+        return get_worksheet(sheet_name)
+
+
+def date_sheet_row(reservation):
+    """Row written to the date sheet for a reservation dict"""
+    return [reservation['name'], reservation['time'], reservation['people'],
+            reservation['phone'], reservation['email'], reservation['date'],
+            reservation['dish_type'], reservation['notes'], "Pending",
+            reservation['reservation_id'] or ""]
+
+
+# Reservation fields staff and SMS replies change, and their date sheet column
+DATE_SHEET_COLUMNS = {'confirmed': 'I', 'sms_reply': 'K', 'confirmation_method': 'L'}
+
+
+def row_updates(row_number, fields):
+    """batch_update ranges writing `fields` to one date sheet row"""
+    return [{'range': f'{DATE_SHEET_COLUMNS[field]}{row_number}', 'values': [[value]]}
+            for field, value in fields.items() if field in DATE_SHEET_COLUMNS]
+
+
+def append_date_rows(sheet_name, rows):
+    """Append booking rows to a date sheet in one call and tell the store"""
+    date_sheet = ensure_date_sheet(sheet_name)
+    response = date_sheet.append_rows(rows)
+    reservation_store.rows_appended(sheet_name, rows, row_from_append(response))
+
+
+def create_date_sheet(name, phone, email, people, date, time, dish_type, notes, reservation_id):
+    """Create a new sheet for the date and add booking details"""
+    try:
+        sheet_name = str(date).replace('/', '-')
+        append_date_rows(sheet_name, [[name, time, people, phone, email, date,
+                                       dish_type, notes, "Pending", reservation_id or ""]])
+
+    except Exception as e:
+        print(f"Error creating/updating date sheet: {e}")
+        reservation_cache.invalidate(str(date).replace('/', '-'))
+
+
+SMS_SENDER = "61485900180"
+# Mobile Message accepts up to 100 messages per request
+SMS_BATCH_LIMIT = int(os.environ.get('SMS_BATCH_LIMIT', 100))
+
+
+def _post_sms_payload(payload):
+    """
+    POST a messages payload to Mobile Message. Returns the parsed response,
+    None if the request was refused, or False if it failed in a way that may
+    still have delivered the messages (a 5xx other than 503, a read timeout).
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Basic {AUTH_HEADER}"
+    }
+    try:
+        with track_outbound('mobile_message', 'send') as call:
+            response = sms_http.post(
+                API_URL, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
+            if response.status_code != 200:
+                call['outcome'] = f'http_{response.status_code}'
+
+        if response.status_code != 200:
+            print(f"Error {response.status_code}: {response.text}")
+            return None if response.status_code < 500 or response.status_code == 503 else False
+
+        response_data = response.json()
+        print("SMS API Response:", json.dumps(response_data, indent=2))
+        return response_data
+    except requests.exceptions.ConnectTimeout as e:
+        print(f"Error sending SMS: {e}")
+        return None
+    except Exception as e:
+        print(f"Error sending SMS: {e}")
+        return False
+
+
+def send_sms(to_number, message_text, custom_ref=None):
+    """Send SMS using Mobile Message API"""
+    payload = {
+        "messages": [
+            {
+                "to": to_number,
+                "message": message_text,
+                "sender": SMS_SENDER
+            }
+        ]
+    }
+    if custom_ref:
+        payload["messages"][0]["custom_ref"] = custom_ref
+    print("DEBUG Payload:", json.dumps(payload, indent=2))
+
+    return _post_sms_payload(payload)
+
+
+def send_sms_batch(messages):
+    """
+    Send many SMS with as few requests as possible.
+    `messages` is a list of dicts with "to", "message" and optional "custom_ref".
+    Returns a list aligned with `messages` holding each message's result dict,
+    None where that message (or its whole request) was refused, or False where
+    its request failed but may still have been delivered.
+    """
+    results = []
+    for start in range(0, len(messages), SMS_BATCH_LIMIT):
+        chunk = messages[start:start + SMS_BATCH_LIMIT]
+        payload = {"messages": [dict(m, sender=SMS_SENDER) for m in chunk]}
+        print(f"Sending SMS batch of {len(chunk)} message(s)")
+
+        response_data = _post_sms_payload(payload)
+        if response_data is False:
+            results.extend([False] * len(chunk))
+            continue
+        chunk_results = (response_data or {}).get('results') or []
+
+        # Match by custom_ref where the provider echoes it, else by position
+        by_ref = {r.get('custom_ref'): r for r in chunk_results if r.get('custom_ref')}
+        for i, message in enumerate(chunk):
+            result = by_ref.get(message.get('custom_ref'))
+            if result is None and not by_ref and i < len(chunk_results):
+                result = chunk_results[i]
+            if result is not None and str(result.get('status', '')).lower() == 'error':
+                print(f"SMS to {message['to']} rejected: {result}")
+                result = None
+            results.append(result)
+
+    return results
+
+
+def init_sms_runs():
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sms_runs (
+                date TEXT NOT NULL,
+                message_type TEXT NOT NULL,
+                status TEXT NOT NULL,
+                started_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                finished_at TEXT,
+                last_error TEXT,
+                PRIMARY KEY (date, message_type)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sms_run_items (
+                date TEXT NOT NULL,
+                message_type TEXT NOT NULL,
+                reservation_id TEXT NOT NULL,
+                row_number INTEGER,
+                phone TEXT,
+                status TEXT NOT NULL DEFAULT 'pending',
+                message_id TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TEXT NOT NULL,
+                PRIMARY KEY (date, message_type, reservation_id)
+            )
+        """)
+
+
+def send_sms_on_date(target_date, message_type="day_of"):
+    """
+    Text every Pending reservation on a date. There is one run per date and
+    message type; each reservation's send state is checkpointed after every
+    SMS batch, so a re-run or a resumed run skips anyone already texted.
+    """
+    try:
+        sheet_name = target_date.replace('/', '-')
+        with try_process_lock('sms_run') as acquired:
+            if not acquired:
+                return "An SMS run is already in progress; check /staff/api/sms-runs"
+            return _run_sms_reminders(sheet_name, message_type)
+
+    except Exception as e:
+        with closing(state_db()) as conn, conn:
+            conn.execute(
+                "UPDATE sms_runs SET last_error = ?, updated_at = ? WHERE date = ? AND message_type = ?",
+                (str(e), datetime.now().isoformat(), target_date.replace('/', '-'), message_type))
+        return f"Error sending SMS for {target_date}: {e}"
+
+
+def _run_sms_reminders(sheet_name, message_type, reservation_ids=None):
+    """
+    Send the run's outstanding texts. With `reservation_ids` only those
+    bookings are texted (one per-booking reminder); the run row then stays
+    'scheduled' so resume_sms_runs never turns it into a whole-day send.
+    """
+    reservations = reservation_store.for_date(sheet_name)
+    if not reservations:
+        return f"No reservations found for {sheet_name}"
+
+    pending = {r['reservation_id']: r for r in reservations
+               if r['reservation_id'] and r['confirmed'] == "Pending" and r['phone']
+               and (reservation_ids is None or r['reservation_id'] in reservation_ids)}
+    scope = list(reservation_ids or ())
+    in_scope = ("" if reservation_ids is None
+                else " AND reservation_id IN (" + ", ".join('?' * len(scope)) + ")")
+    run = (sheet_name, message_type)
+    now = datetime.now().isoformat()
+
+    with closing(state_db()) as conn:
+        with conn:
+            if reservation_ids is None:
+                conn.execute(
+                    "INSERT INTO sms_runs (date, message_type, status, started_at, updated_at) "
+                    "VALUES (?, ?, 'running', ?, ?) ON CONFLICT (date, message_type) DO UPDATE SET "
+                    "status = 'running', updated_at = excluded.updated_at, finished_at = NULL, "
+                    "last_error = NULL", (*run, now, now))
+            else:
+                conn.execute(
+                    "INSERT INTO sms_runs (date, message_type, status, started_at, updated_at) "
+                    "VALUES (?, ?, 'scheduled', ?, ?) ON CONFLICT (date, message_type) DO UPDATE SET "
+                    "updated_at = excluded.updated_at", (*run, now, now))
+            # A batch cut off mid-request may have gone out; never risk texting twice
+            conn.execute("UPDATE sms_run_items SET status = 'uncertain' "
+                         "WHERE date = ? AND message_type = ? AND status = 'sending'", run)
+            conn.executemany(
+                "INSERT INTO sms_run_items (date, message_type, reservation_id, row_number, phone, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (date, message_type, reservation_id) DO UPDATE SET "
+                "row_number = excluded.row_number, phone = excluded.phone",
+                [(*run, rid, r['row_number'], r['phone'], now) for rid, r in pending.items()])
+            # Replied or cancelled since the run began; nothing to send
+            conn.execute(
+                "UPDATE sms_run_items SET status = 'skipped' WHERE date = ? AND message_type = ? "
+                "AND status IN ('pending', 'failed') AND reservation_id NOT IN ("
+                + ", ".join('?' * len(pending)) + ")" + in_scope, (*run, *pending, *scope))
+        done = {rid for (rid,) in conn.execute(
+            "SELECT reservation_id FROM sms_run_items WHERE date = ? AND message_type = ? "
+            "AND status IN ('sent', 'uncertain')", run)}
+
+        todo = [r for rid, r in pending.items() if rid not in done]
+        sent_count = 0
+        failed_count = 0
+        for start in range(0, len(todo), SMS_BATCH_LIMIT):
+            chunk = todo[start:start + SMS_BATCH_LIMIT]
+            with conn:
+                conn.executemany(
+                    "UPDATE sms_run_items SET status = 'sending', attempts = attempts + 1, updated_at = ? "
+                    "WHERE date = ? AND message_type = ? AND reservation_id = ?",
+                    [(datetime.now().isoformat(), *run, r['reservation_id']) for r in chunk])
+
+            results = send_sms_batch([{
+                "to": r['phone'],
+                "message": (
+                    f"Hi {r['name']}! This is a reminder of your reservation today "
+                    f"at {r['time']} for {r['people']} people.\n"
+                    f"Reply Y to confirm or N to cancel.\n"
+                    f"Location: 71 Dixon St (up the stairs), Haymarket - JLD Hotpot"
+                ),
+                "custom_ref": f"{message_type}_{r['reservation_id']}_{sheet_name}"
+            } for r in chunk])
+
+            # Checkpoint this batch before sending the next
+            timestamp = datetime.now().strftime('%H:%M')
+            changes = {}
+            with conn:
+                for r, result in zip(chunk, results):
+                    # Never resend a message that may have gone out
+                    status = 'sent' if result else 'uncertain' if result is False else 'failed'
+                    conn.execute(
+                        "UPDATE sms_run_items SET status = ?, message_id = ?, updated_at = ? "
+                        "WHERE date = ? AND message_type = ? AND reservation_id = ?",
+                        (status, (result or {}).get('message_id'), datetime.now().isoformat(),
+                         *run, r['reservation_id']))
+                    changes[r['row_number']] = {'sms_reply': f"{message_type} SMS {status} {timestamp}"}
+                conn.execute("UPDATE sms_runs SET updated_at = ? WHERE date = ? AND message_type = ?",
+                             (datetime.now().isoformat(), *run))
+            sent_count += sum(1 for result in results if result)
+            failed_count += sum(1 for result in results if not result)
+            reservation_store.update_rows(sheet_name, changes)
+
+        if reservation_ids is None:
+            finished_at = datetime.now().isoformat()
+            with conn:
+                conn.execute(
+                    "UPDATE sms_runs SET status = 'completed', updated_at = ?, finished_at = ? "
+                    "WHERE date = ? AND message_type = ?", (finished_at, finished_at, *run))
+
+    return (f"SMS Summary for {sheet_name}: {sent_count} sent successfully, {failed_count} failed, "
+            f"{len(pending) - len(todo)} already sent")
+
+
+def sms_run_status(date, message_type):
+    """A reminder run with per-status counts and its reservations, or None"""
+    with closing(state_db()) as conn:
+        run = conn.execute(
+            "SELECT date, message_type, status, started_at, updated_at, finished_at, last_error "
+            "FROM sms_runs WHERE date = ? AND message_type = ?", (date, message_type)).fetchone()
+        if run is None:
+            return None
+        items = conn.execute(
+            "SELECT reservation_id, row_number, phone, status, message_id, attempts, updated_at "
+            "FROM sms_run_items WHERE date = ? AND message_type = ? ORDER BY row_number",
+            (date, message_type)).fetchall()
+
+    status = dict(zip(('date', 'message_type', 'status', 'started_at', 'updated_at',
+                       'finished_at', 'last_error'), run))
+    status['counts'] = {}
+    for item in items:
+        status['counts'][item[3]] = status['counts'].get(item[3], 0) + 1
+    status['total'] = len(items)
+    status['reservations'] = [dict(zip(('reservation_id', 'row_number', 'phone', 'status',
+                                        'message_id', 'attempts', 'updated_at'), item))
+                              for item in items]
+    return status
+
+
+def recent_sms_runs(limit=20):
+    with closing(state_db()) as conn:
+        runs = conn.execute(
+            "SELECT date, message_type FROM sms_runs ORDER BY started_at DESC LIMIT ?",
+            (limit,)).fetchall()
+    return [sms_run_status(date, message_type) for date, message_type in runs]
+
+
+@timed_job('resume_sms_runs')
+def resume_sms_runs():
+    """Finish today's and later runs that a restart cut short"""
+    today = datetime.now(sydney_tz).strftime('%Y-%m-%d')
+    with closing(state_db()) as conn:
+        runs = conn.execute(
+            "SELECT date, message_type FROM sms_runs WHERE status = 'running' AND date >= ?",
+            (today,)).fetchall()
+    for date, message_type in runs:
+        print(f"Resuming {message_type} SMS run for {date}: {send_sms_on_date(date, message_type)}")
+
+
+# Per-booking reminders: each booking gets a job in the 'reminders' job store
+# that texts it REMINDER_HOURS_BEFORE its time, spreading sends and replies
+# across the day. A follower's new job is picked up the next time the leader
+# wakes. Jobs that run late past misfire_grace_time are dropped by APScheduler;
+# the reminder sweep sends those (see send_overdue_reminders).
+REMINDER_HOURS_BEFORE = float(os.environ.get('REMINDER_HOURS_BEFORE', 3))
+REMINDER_RETRY_DELAY = int(os.environ.get('REMINDER_RETRY_DELAY', 60))
+# Overdue reminders aren't sent once the booking is this close
+REMINDER_MIN_LEAD_MINUTES = int(os.environ.get('REMINDER_MIN_LEAD_MINUTES', 30))
+
+
+def reminder_job_id(sheet_name, reservation_id):
+    return f"reminder_{sheet_name}_{reservation_id}"
+
+
+def init_reminder_schedule():
+    # Bookings that were given a reminder job; the sweep only sends these
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reminder_schedule (
+                date TEXT NOT NULL,
+                reservation_id TEXT NOT NULL,
+                run_at TEXT NOT NULL,
+                PRIMARY KEY (date, reservation_id)
+            )
+        """)
+
+
+def reminder_run_time(sheet_name, reservation):
+    """When a booking's reminder goes out (Sydney time)"""
+    day = datetime.strptime(sheet_name, '%Y-%m-%d').date()
+    booked_for = sydney_tz.localize(datetime.combine(day, reservation_sort_key(reservation)))
+    return booked_for - timedelta(hours=REMINDER_HOURS_BEFORE)
+
+
+def schedule_reservation_reminder(reservation):
+    """
+    Add the reminder job for a new booking. Bookings made too late for one
+    get none. Never raises: a booking must not fail over its reminder.
+    """
+    try:
+        sheet_name = str(reservation['date']).replace('/', '-')
+        reservation_id = str(reservation['reservation_id'])
+        run_at = reminder_run_time(sheet_name, reservation)
+        if run_at <= datetime.now(sydney_tz):
+            return None
+        job = scheduler.add_job(
+            send_reservation_reminder,
+            trigger=DateTrigger(run_date=run_at),
+            args=[sheet_name, reservation_id],
+            id=reminder_job_id(sheet_name, reservation_id),
+            name=f'Reminder {reservation_id}',
+            jobstore='reminders',
+            replace_existing=True)
+        with closing(state_db()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO reminder_schedule (date, reservation_id, run_at) "
+                         "VALUES (?, ?, ?)", (sheet_name, reservation_id, run_at.isoformat()))
+        return job
+    except Exception as e:
+        print(f"Could not schedule reminder for reservation {reservation.get('reservation_id')}: {e}")
+        return None
+
+
+def upcoming_dates():
+    """Date sheet names from today to the end of the phone index window"""
+    today = datetime.now(sydney_tz).date()
+    _, end = phone_index.window()
+    return [(today + timedelta(days=i)).strftime('%Y-%m-%d')
+            for i in range((end - today).days + 1)]
+
+
+def schedule_upcoming_reminders():
+    """
+    Add missing reminder jobs for Pending bookings in the upcoming window,
+    e.g. ones made before this release, or rows with a reservation ID that
+    reconcile picked up from a date tab. Returns the number of jobs added.
+    """
+    dates = upcoming_dates()
+    scheduled = {job.id for job in scheduler.get_jobs(jobstore='reminders')}
+
+    added = 0
+    for sheet_name, reservations in reservation_store.for_dates(dates).items():
+        for r in reservations:
+            if (r['reservation_id'] and r['confirmed'] == "Pending" and r['phone']
+                    and reminder_job_id(sheet_name, r['reservation_id']) not in scheduled
+                    and schedule_reservation_reminder(dict(r, date=sheet_name))):
+                added += 1
+    return added
+
+
+def send_overdue_reminders():
+    """
+    Text today's Pending bookings whose reminder time has passed, e.g. their
+    job was dropped after a cold start, while the booking is still at least
+    REMINDER_MIN_LEAD_MINUTES away. Only bookings that were given a reminder
+    job count: ones made too late for a reminder still get none. Goes through
+    the day's SMS run, so anyone already texted (or possibly texted) is skipped.
+    """
+    now = datetime.now(sydney_tz)
+    today = now.strftime('%Y-%m-%d')
+    with closing(state_db()) as conn, conn:
+        conn.execute("DELETE FROM reminder_schedule WHERE date < ?", (today,))
+        scheduled = {reservation_id for (reservation_id,) in conn.execute(
+            "SELECT reservation_id FROM reminder_schedule WHERE date = ?", (today,))}
+    if not scheduled:
+        return "none due"
+
+    cutoff = now + timedelta(minutes=REMINDER_MIN_LEAD_MINUTES - REMINDER_HOURS_BEFORE * 60)
+    overdue = {r['reservation_id'] for r in reservation_store.for_date(today)
+               if r['reservation_id'] in scheduled and r['confirmed'] == "Pending" and r['phone']
+               and cutoff <= reminder_run_time(today, r) <= now}
+    if not overdue:
+        return "none due"
+
+    with try_process_lock('sms_run') as acquired:
+        if not acquired:
+            return "an SMS run is in progress; next sweep"
+        return _run_sms_reminders(today, 'day_of', reservation_ids=overdue)
+
+
+init_sms_runs()
+init_reminder_schedule()
+
+
+# =============================================================================
+# RESERVATION JOURNAL (write-behind to Google Sheets)
+# =============================================================================
+
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get('JOURNAL_FLUSH_INTERVAL', 2))
+JOURNAL_MAX_BACKOFF = float(os.environ.get('JOURNAL_MAX_BACKOFF', 120))
+JOURNAL_BATCH_SIZE = int(os.environ.get('JOURNAL_BATCH_SIZE', 200))
+# After a wake-up, wait this long so a burst of bookings lands in one batch
+JOURNAL_BATCH_WINDOW = float(os.environ.get('JOURNAL_BATCH_WINDOW', 0.5))
+
+_journal_wakeup = threading.Event()
+
+
+def init_reservation_journal():
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reservation_journal (
+                reservation_id INTEGER PRIMARY KEY,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL,
+                -- 0 pending, 1 written, 2 uncertain (an append that may have landed)
+                master_written INTEGER NOT NULL DEFAULT 0,
+                date_written INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT
+            )
+        """)
+
+
+def _insert_journal_entry(conn, reservation_data):
+    conn.execute(
+        "INSERT INTO reservation_journal (reservation_id, payload, created_at) VALUES (?, ?, ?)",
+        (reservation_data['reservation_id'], json.dumps(reservation_data),
+         datetime.now().isoformat()))
+
+
+def journal_reservation(reservation_data):
+    """Durably record a booking; the flusher writes it to Sheets later"""
+    with closing(state_db()) as conn, conn:
+        _insert_journal_entry(conn, reservation_data)
+    _journal_wakeup.set()
+
+
+def flush_reservation_journal():
+    """
+    Write pending journal entries to Master Data and the date sheets with one
+    append_rows call per sheet. Each entry tracks both writes separately, and
+    an append that failed after it may have reached Google is marked uncertain
+    and only resent if its reservation ID isn't on the sheet, so a retry never
+    duplicates rows. Queued row changes from the reservation store are
+    mirrored afterwards.
+    Returns (flushed, failed).
+    """
+    with try_process_lock('journal') as acquired:
+        if not acquired:
+            return 0, 0  # Another worker is flushing
+
+        with closing(state_db()) as conn:
+            flushed, failed = _flush_journal_entries(conn)
+            mirrored, mirror_failed = reservation_store.flush_mirror(conn)
+            return flushed + mirrored, failed + mirror_failed
+
+
+def _flush_journal_entries(conn):
+    entries = conn.execute(
+        "SELECT reservation_id, payload, master_written, date_written "
+        "FROM reservation_journal ORDER BY reservation_id LIMIT ?",
+        (JOURNAL_BATCH_SIZE,)).fetchall()
+    if not entries:
+        return 0, 0
+
+    failed = set()
+
+    def mark(column, ids, value):
+        with conn:
+            conn.executemany(f"UPDATE reservation_journal SET {column} = ? WHERE reservation_id = ?",
+                             [(value, i) for i in ids])
+
+    def record_failure(ids, error, column=None):
+        failed.update(ids)
+        with conn:
+            conn.executemany(
+                "UPDATE reservation_journal SET attempts = attempts + 1, last_error = ? "
+                "WHERE reservation_id = ?", [(str(error), i) for i in ids])
+        if column and sheets_write_may_have_landed(error):
+            mark(column, ids, 2)
+
+    def drop_landed(items, column, read_ids):
+        """
+        Mark uncertain entries whose reservation ID is on the sheet as written
+        and return the rest, or None if the sheet couldn't be read
+        """
+        uncertain = [rid for rid, _, written in items if written == 2]
+        if not uncertain:
+            return items
+        try:
+            on_sheet = set(read_ids())
+        except Exception as e:
+            print(f"Journal check of uncertain {column} appends failed: {e}")
+            record_failure(uncertain, e)
+            return None
+        landed = {rid for rid in uncertain if str(rid) in on_sheet}
+        mark(column, landed, 1)
+        return [item for item in items if item[0] not in landed]
+
+    master = [(rid, json.loads(p), m) for rid, p, m, _ in entries if m != 1]
+    if master:
+        master = drop_landed(master, 'master_written',
+                             lambda: sheet.col_values(1))  # Column A: Reservation ID
+    if master:
+        try:
+            sheet.append_rows([
+                [r['reservation_id'], r['name'], r['date'], r['time'], r['people'],
+                 r['dish_type'], r['phone'], r['email'], r['notes']]
+                for _, r, _ in master])
+            mark('master_written', [rid for rid, _, _ in master], 1)
+        except Exception as e:
+            print(f"Journal flush to Master Data failed: {e}")
+            record_failure([rid for rid, _, _ in master], e, 'master_written')
+
+    by_date = {}
+    for rid, payload, _, date_written in entries:
+        if date_written != 1:
+            reservation = json.loads(payload)
+            sheet_name = str(reservation['date']).replace('/', '-')
+            by_date.setdefault(sheet_name, []).append((rid, reservation, date_written))
+
+    def tab_ids(sheet_name):
+        try:
+            return get_worksheet(sheet_name).col_values(10)  # Column J: Reservation ID
+        except gspread.WorksheetNotFound:
+            return []
+
+    for sheet_name, items in by_date.items():
+        pending = drop_landed(items, 'date_written', lambda: tab_ids(sheet_name))
+        if pending is None:
+            continue
+        pending_ids = {rid for rid, _, _ in pending}
+        landed = [date_sheet_row(r) for rid, r, _ in items if rid not in pending_ids]
+        if landed:
+            # Their positions on the tab aren't known; the store finds them by ID
+            reservation_store.rows_appended(sheet_name, landed, None)
+        if not pending:
+            continue
+        try:
+            append_date_rows(sheet_name, [date_sheet_row(r) for _, r, _ in pending])
+            mark('date_written', [rid for rid, _, _ in pending], 1)
+        except Exception as e:
+            print(f"Journal flush to {sheet_name} failed: {e}")
+            reservation_cache.invalidate(sheet_name)
+            record_failure([rid for rid, _, _ in pending], e, 'date_written')
+
+    with conn:
+        flushed = conn.execute(
+            "DELETE FROM reservation_journal WHERE master_written = 1 AND date_written = 1").rowcount
+
+    if flushed:
+        print(f"Journal flushed {flushed} reservation(s) to Google Sheets")
+    return flushed, len(failed)
+
+
+def _journal_flusher():
+    """Background loop: flush on wake-up or interval, backing off on failure"""
+    delay = JOURNAL_FLUSH_INTERVAL
+    while True:
+        if _journal_wakeup.wait(delay):
+            sleep(JOURNAL_BATCH_WINDOW)
+        _journal_wakeup.clear()
+        try:
+            _, failed = flush_reservation_journal()
+        except Exception as e:
+            print(f"Journal flush error: {e}")
+            failed = 1
+        delay = min(delay * 2, JOURNAL_MAX_BACKOFF) if failed else JOURNAL_FLUSH_INTERVAL
+
+
+init_reservation_journal()
+threading.Thread(target=_journal_flusher, name='journal-flusher', daemon=True).start()
+
+
+# =============================================================================
+# RESERVATION STORE
+# =============================================================================
+# Routes and jobs read and change reservations through `reservation_store`.
+# With RESERVATION_STORE=sqlite (the default) state.db is the system of record
+# and the journal flusher mirrors it one way to Master Data and the date tabs;
+# RESERVATION_STORE=sheets keeps reading and writing the sheet directly.
+RESERVATION_STORE = os.environ.get('RESERVATION_STORE', 'sqlite')
+
+
+class ReservationStore(ABC):
+    """
+    Reservations are addressed by (date sheet name, row_number) and returned
+    as parse_reservation_row() dicts. Changeable fields are the keys of
+    DATE_SHEET_COLUMNS.
+    """
+
+    # Whether bookings still waiting in the journal are visible to readers
+    includes_pending_writes = False
+
+    @abstractmethod
+    def add(self, reservation):
+        """Durably record a new booking; returns the stored dict or None if its row isn't known yet"""
+
+    @abstractmethod
+    def for_dates(self, sheet_names):
+        """{sheet_name: [reservation, ...]} for each date; missing dates give []"""
+
+    def for_date(self, sheet_name):
+        return self.for_dates([sheet_name])[sheet_name]
+
+    @abstractmethod
+    def find_by_phone(self, phone, reply_date):
+        """
+        (sheet_name, row_number, name) of the booking a reply sent on
+        reply_date is about, or None
+        """
+
+    @abstractmethod
+    def update_rows(self, sheet_name, changes):
+        """
+        Apply {row_number: {field: value}} to one date.
+        Returns {row_number: reservation as it was before} for known rows.
+        """
+
+    def warm(self, sheet_names):
+        """Load a window of dates ahead of use; returns for_dates()"""
+        return self.for_dates(sheet_names)
+
+    def rows_appended(self, sheet_name, rows, first_row):
+        """The journal appended `rows` to a date tab from first_row (None if unknown)"""
+
+    def flush_mirror(self, conn):
+        """Write queued changes to Sheets (under the journal lock); returns (written, failed)"""
+        return 0, 0
+
+    def forget(self, sheet_names):
+        """Drop dates that have been archived"""
+
+    def reconcile(self, sheet_names):
+        """Pick up rows added or edited on the date tabs by hand; returns the dates that changed"""
+        return []
+
+
+class SheetsReservationStore(ReservationStore):
+    """The sheet is the record: reads go through the cache, changes are written straight to Sheets"""
+
+    def add(self, reservation):
+        journal_reservation(reservation)
+        return None  # Published once the flusher has appended it
+
+    def for_dates(self, sheet_names):
+        return load_reservations_for_dates(sheet_names)
+
+    def for_date(self, sheet_name):
+        return load_date_reservations(sheet_name)
+
+    def find_by_phone(self, phone, reply_date):
+        phone_index.prune()
+        match = phone_index.lookup(phone, reply_date)
+        if match:
+            print(f"✓ Indexed reservation in {match[0]}, row {match[1]}")
+            return match
+
+        try:
+            date_sheet = get_worksheet(reply_date)
+        except gspread.WorksheetNotFound:
+            print(f"Sheet not found: {reply_date}")
+            return None
+
+        cell = date_sheet.find(clean_phone(phone) or phone, in_column=4)
+        if not cell:
+            cell = date_sheet.find(phone, in_column=4)
+        if not cell:
+            return None
+
+        print(f"✓ Found reservation in {reply_date}, row {cell.row}")
+        row_data = date_sheet.row_values(cell.row)
+        name = row_data[0] if len(row_data) > 0 else "Unknown"
+        return reply_date, cell.row, name
+
+    def update_rows(self, sheet_name, changes):
+        previous = {r['row_number']: r for r in self.for_date(sheet_name)
+                    if r['row_number'] in changes}
+        get_worksheet(sheet_name).batch_update(
+            [u for row_number, fields in changes.items() for u in row_updates(row_number, fields)])
+        for row_number, fields in changes.items():
+            reservation_cache.update_row(sheet_name, row_number, **fields)
+        return previous
+
+    def warm(self, sheet_names):
+        existing = worksheet_titles()
+        loaded = read_date_sheets([n for n in sheet_names if n in existing])
+        for sheet_name in sheet_names:
+            if sheet_name not in loaded:
+                reservation_cache.set(sheet_name, [])
+                loaded[sheet_name] = []
+        return loaded
+
+    def rows_appended(self, sheet_name, rows, first_row):
+        if not first_row:
+            reservation_cache.invalidate(sheet_name)
+            publish_reservation_event(sheet_name, 'refresh', {})
+            return
+
+        added = []
+        for offset, row in enumerate(rows):
+            reservation = parse_reservation_row([str(v) for v in row], first_row + offset)
+            reservation_cache.append(sheet_name, reservation)
+            phone_index.add(sheet_name, reservation)
+            added.append(reservation)
+        publish_reservation_events(sheet_name, 'reservation', added)
+
+    def forget(self, sheet_names):
+        for sheet_name in sheet_names:
+            reservation_cache.invalidate(sheet_name)
+
+
+class SQLiteReservationStore(ReservationStore):
+    """
+    state.db is the record. A date is copied from its tab the first time it
+    is used (warm-up does the upcoming window in one read); after that reads
+    never touch Sheets. Rows staff type into or edit on upcoming tabs come in
+    through reconcile(), run every RESERVATION_RECONCILE_MINUTES. New bookings
+    go to the journal as before and row changes queue in sheet_mirror, both
+    written out by the journal flusher.
+
+    row_number is this store's key for a row: the tab row for imported rows,
+    the next free row for new bookings. sheet_row is where the row actually
+    is on the tab, learned from the append and used by the mirror.
+    """
+
+    includes_pending_writes = True
+
+    COLUMNS = ('name', 'time', 'people', 'phone', 'email', 'dish_type', 'notes',
+               'confirmed', 'reservation_id', 'sms_reply', 'confirmation_method')
+    SELECT = "SELECT date, row_number, " + ", ".join(COLUMNS) + " FROM reservations"
+
+    def __init__(self):
+        self._imported = set()  # Dates known to be in state.db; saves a query per read
+
+    def init(self):
+        with closing(state_db()) as conn, conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reservations (
+                    date TEXT NOT NULL,
+                    row_number INTEGER NOT NULL,
+                    reservation_id INTEGER,
+                    name TEXT NOT NULL DEFAULT '',
+                    time TEXT NOT NULL DEFAULT '',
+                    people TEXT NOT NULL DEFAULT '',
+                    phone TEXT NOT NULL DEFAULT '',
+                    phone_key TEXT,
+                    email TEXT NOT NULL DEFAULT '',
+                    dish_type TEXT NOT NULL DEFAULT '',
+                    notes TEXT NOT NULL DEFAULT '',
+                    confirmed TEXT NOT NULL DEFAULT 'Pending',
+                    sms_reply TEXT NOT NULL DEFAULT '',
+                    confirmation_method TEXT NOT NULL DEFAULT '',
+                    sheet_row INTEGER,
+                    created_at TEXT NOT NULL,
+                    updated_at TEXT NOT NULL,
+                    PRIMARY KEY (date, row_number)
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS reservations_phone "
+                         "ON reservations (phone_key, date)")
+            conn.execute("CREATE INDEX IF NOT EXISTS reservations_reservation_id "
+                         "ON reservations (reservation_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS reservations_status "
+                         "ON reservations (confirmed, date)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS reservation_import (
+                    date TEXT PRIMARY KEY,
+                    imported_at TEXT NOT NULL
+                )
+            """)
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sheet_mirror (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    date TEXT NOT NULL,
+                    row_number INTEGER NOT NULL,
+                    fields TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT
+                )
+            """)
+
+    def _as_reservation(self, values):
+        reservation = dict(zip(('date', 'row_number') + self.COLUMNS, values))
+        reservation['reservation_id'] = str(reservation['reservation_id'] or '')
+        return reservation
+
+    def _next_row(self, conn, sheet_name):
+        # Row 1 is the header
+        return conn.execute(
+            "SELECT COALESCE(MAX(row_number), 1) + 1 FROM reservations WHERE date = ?",
+            (sheet_name,)).fetchone()[0]
+
+    def _insert(self, conn, sheet_name, reservation, sheet_row, now):
+        reservation_id = str(reservation.get('reservation_id') or '')
+        conn.execute(
+            "INSERT OR IGNORE INTO reservations (date, row_number, reservation_id, phone_key, "
+            + ", ".join(c for c in self.COLUMNS if c != 'reservation_id')
+            + ", sheet_row, created_at, updated_at) VALUES ("
+            + ", ".join('?' * (len(self.COLUMNS) + 6)) + ")",
+            [sheet_name, reservation['row_number'],
+             int(reservation_id) if reservation_id.isdigit() else None,
+             clean_phone(reservation.get('phone'))]
+            + [reservation.get(c) or '' for c in self.COLUMNS if c != 'reservation_id']
+            + [sheet_row, now, now])
+
+    def _import(self, sheet_names):
+        """Copy dates never seen before from their tabs (one batched read)"""
+        sheet_names = [n for n in dict.fromkeys(sheet_names) if n not in self._imported]
+        if not sheet_names:
+            return
+        marks = ", ".join('?' * len(sheet_names))
+        with closing(state_db()) as conn:
+            done = {d for (d,) in conn.execute(
+                f"SELECT date FROM reservation_import WHERE date IN ({marks})", sheet_names)}
+        self._imported.update(done)
+        todo = [n for n in sheet_names if n not in done]
+        if not todo:
+            return
+
+        existing = worksheet_titles(expected=todo)
+        fetched = fetch_date_tabs([n for n in todo if n in existing])
+        now = datetime.now().isoformat()
+
+        with closing(state_db()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            done = {d for (d,) in conn.execute(
+                f"SELECT date FROM reservation_import WHERE date IN ({marks})", sheet_names)}
+            # Bookings journaled before this store was in use aren't on the tab yet
+            pending = [json.loads(p) for (p,) in conn.execute(
+                "SELECT payload FROM reservation_journal WHERE date_written != 1")]
+            for sheet_name in todo:
+                if sheet_name in done:
+                    continue
+                rows = fetched.get(sheet_name, [])
+                for reservation in rows:
+                    self._insert(conn, sheet_name, reservation, reservation['row_number'], now)
+                on_tab = {r['reservation_id'] for r in rows}
+                for booking in pending:
+                    if (str(booking['date']).replace('/', '-') == sheet_name
+                            and str(booking['reservation_id']) not in on_tab):
+                        reservation = parse_reservation_row(
+                            [str(v) for v in date_sheet_row(booking)], self._next_row(conn, sheet_name))
+                        self._insert(conn, sheet_name, reservation, None, now)
+                conn.execute("INSERT INTO reservation_import (date, imported_at) VALUES (?, ?)",
+                             (sheet_name, now))
+            conn.commit()
+        self._imported.update(todo)
+
+    def add(self, reservation):
+        sheet_name = str(reservation['date']).replace('/', '-')
+        self._import([sheet_name])
+        stored = parse_reservation_row([str(v) for v in date_sheet_row(reservation)], None)
+
+        with closing(state_db()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            stored['row_number'] = self._next_row(conn, sheet_name)
+            self._insert(conn, sheet_name, stored, None, datetime.now().isoformat())
+            _insert_journal_entry(conn, reservation)
+            conn.commit()
+        _journal_wakeup.set()
+
+        stored['date'] = sheet_name
+        publish_reservation_event(sheet_name, 'reservation', stored)
+        return stored
+
+    def for_dates(self, sheet_names):
+        self._import(sheet_names)
+        result = {n: [] for n in sheet_names}
+        marks = ", ".join('?' * len(result))
+        with closing(state_db()) as conn:
+            rows = conn.execute(
+                f"{self.SELECT} WHERE date IN ({marks}) ORDER BY date, row_number",
+                list(result)).fetchall()
+        for values in rows:
+            reservation = self._as_reservation(values)
+            result[reservation['date']].append(reservation)
+        return result
+
+    def find_by_phone(self, phone, reply_date):
+        self._import([reply_date])
+        start, _ = phone_index.window()
+        with closing(state_db()) as conn:
+            matches = conn.execute(
+                "SELECT date, row_number, name FROM reservations "
+                "WHERE phone_key = ? AND date >= ? ORDER BY date, row_number",
+                (clean_phone(phone), start.strftime('%Y-%m-%d'))).fetchall()
+        # The earliest booking on or after the reply, else the latest before it
+        upcoming = [m for m in matches if m[0] >= reply_date]
+        match = upcoming[0] if upcoming else (matches[-1] if matches else None)
+        if match:
+            print(f"✓ Found reservation in {match[0]}, row {match[1]}")
+        return match
+
+    def update_rows(self, sheet_name, changes):
+        self._import([sheet_name])
+        now = datetime.now().isoformat()
+        previous = {}
+        with closing(state_db()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for row_number, fields in changes.items():
+                values = conn.execute(f"{self.SELECT} WHERE date = ? AND row_number = ?",
+                                      (sheet_name, row_number)).fetchone()
+                fields = {k: v for k, v in fields.items() if k in DATE_SHEET_COLUMNS}
+                if values is None or not fields:
+                    continue
+                previous[row_number] = self._as_reservation(values)
+                conn.execute(
+                    f"UPDATE reservations SET {', '.join(f'{k} = ?' for k in fields)}, updated_at = ? "
+                    "WHERE date = ? AND row_number = ?",
+                    [*fields.values(), now, sheet_name, row_number])
+                conn.execute(
+                    "INSERT INTO sheet_mirror (date, row_number, fields, created_at) VALUES (?, ?, ?, ?)",
+                    (sheet_name, row_number, json.dumps(fields), now))
+            conn.commit()
+        if previous:
+            _journal_wakeup.set()
+        return previous
+
+    def rows_appended(self, sheet_name, rows, first_row):
+        if not first_row:
+            return  # The mirror finds these rows by reservation ID when it needs them
+        with closing(state_db()) as conn, conn:
+            conn.executemany(
+                "UPDATE reservations SET sheet_row = ? WHERE date = ? AND reservation_id = ?",
+                [(first_row + offset, sheet_name, int(row[9]))
+                 for offset, row in enumerate(rows) if str(row[9]).isdigit()])
+
+    def flush_mirror(self, conn):
+        """
+        Apply queued row changes with one batch_update per date tab, later
+        changes to a field winning. Rows still waiting in the journal are
+        left queued until their append has happened.
+        """
+        ops = conn.execute(
+            "SELECT m.seq, m.date, m.fields, r.sheet_row, r.reservation_id "
+            "FROM sheet_mirror m LEFT JOIN reservations r "
+            "ON r.date = m.date AND r.row_number = m.row_number "
+            "ORDER BY m.seq LIMIT ?", (JOURNAL_BATCH_SIZE,)).fetchall()
+        if not ops:
+            return 0, 0
+        unwritten = {rid for (rid,) in conn.execute(
+            "SELECT reservation_id FROM reservation_journal WHERE date_written != 1")}
+
+        by_date = {}  # sheet_name -> {'seqs': [...], 'rows': {(sheet_row, reservation_id): fields}}
+        for seq, sheet_name, fields, sheet_row, reservation_id in ops:
+            if sheet_row is None and reservation_id in unwritten:
+                continue
+            group = by_date.setdefault(sheet_name, {'seqs': [], 'rows': {}})
+            group['seqs'].append(seq)
+            group['rows'].setdefault((sheet_row, reservation_id), {}).update(json.loads(fields))
+
+        written = failed = 0
+        for sheet_name, group in by_date.items():
+            try:
+                date_sheet = get_worksheet(sheet_name)
+                updates = []
+                for (sheet_row, reservation_id), fields in group['rows'].items():
+                    if sheet_row is None:
+                        cell = date_sheet.find(str(reservation_id), in_column=10) if reservation_id else None
+                        if not cell:
+                            print(f"Reservation {reservation_id} is not on {sheet_name}; not mirrored")
+                            continue
+                        sheet_row = cell.row
+                        with conn:
+                            conn.execute("UPDATE reservations SET sheet_row = ? "
+                                         "WHERE date = ? AND reservation_id = ?",
+                                         (sheet_row, sheet_name, reservation_id))
+                    updates.extend(row_updates(sheet_row, fields))
+                if updates:
+                    date_sheet.batch_update(updates)
+            except gspread.WorksheetNotFound:
+                print(f"Date sheet {sheet_name} is gone; dropping {len(group['seqs'])} mirrored change(s)")
+            except Exception as e:
+                print(f"Mirror to {sheet_name} failed: {e}")
+                failed += len(group['seqs'])
+                with conn:
+                    conn.executemany(
+                        "UPDATE sheet_mirror SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                        [(str(e), seq) for seq in group['seqs']])
+                continue
+
+            with conn:
+                conn.executemany("DELETE FROM sheet_mirror WHERE seq = ?",
+                                 [(seq,) for seq in group['seqs']])
+            written += len(group['seqs'])
+
+        if written:
+            print(f"Mirrored {written} reservation change(s) to Google Sheets")
+        return written, failed
+
+    def reconcile(self, sheet_names):
+        """
+        Bring imported dates in line with their tabs (one batched read). Rows
+        are matched by reservation ID, or by tab row when they have none.
+        Rows with changes not yet mirrored, or changed since the read, keep
+        this store's values. Call under the journal lock so the mirror can't
+        write while the tabs are being compared.
+        """
+        marks = ", ".join('?' * len(sheet_names))
+        with closing(state_db()) as conn:
+            imported = [d for (d,) in conn.execute(
+                f"SELECT date FROM reservation_import WHERE date IN ({marks})", list(sheet_names))]
+        existing = worksheet_titles()
+        started = datetime.now().isoformat()
+        fetched = fetch_date_tabs([n for n in imported if n in existing])
+        editable = [c for c in self.COLUMNS if c != 'reservation_id']
+
+        changed = []
+        with closing(state_db()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            unwritten = {rid for (rid,) in conn.execute(
+                "SELECT reservation_id FROM reservation_journal WHERE date_written != 1")}
+            for sheet_name, tab_rows in fetched.items():
+                queued = {n for (n,) in conn.execute(
+                    "SELECT row_number FROM sheet_mirror WHERE date = ?", (sheet_name,))}
+                stored = [dict(zip(('row_number', 'reservation_id', 'sheet_row', 'updated_at') + tuple(editable), v))
+                          for v in conn.execute(
+                              "SELECT row_number, reservation_id, sheet_row, updated_at, "
+                              + ", ".join(editable) + " FROM reservations WHERE date = ?", (sheet_name,))]
+                by_id = {str(r['reservation_id']): r for r in stored if r['reservation_id']}
+                by_row = {r['sheet_row']: r for r in stored if not r['reservation_id'] and r['sheet_row']}
+                seen = set()
+                dirty = False
+
+                for tab in tab_rows:
+                    mine = (by_id.get(tab['reservation_id']) if tab['reservation_id']
+                            else by_row.get(tab['row_number']))
+                    if mine is None:
+                        added = dict(tab, row_number=self._next_row(conn, sheet_name))
+                        self._insert(conn, sheet_name, added, tab['row_number'], started)
+                        self._adjust_occupancy(conn, sheet_name, None, added)
+                        dirty = True
+                        continue
+
+                    seen.add(mine['row_number'])
+                    fields = {c: tab[c] or '' for c in editable if (tab[c] or '') != mine[c]}
+                    if mine['row_number'] in queued or mine['updated_at'] > started:
+                        fields = {}
+                    if fields or mine['sheet_row'] != tab['row_number']:
+                        conn.execute(
+                            "UPDATE reservations SET "
+                            + "".join(f"{k} = ?, " for k in fields)
+                            + "phone_key = ?, sheet_row = ?, updated_at = ? WHERE date = ? AND row_number = ?",
+                            [*fields.values(), clean_phone(fields.get('phone', mine['phone'])),
+                             tab['row_number'], started, sheet_name, mine['row_number']])
+                    if fields:
+                        self._adjust_occupancy(conn, sheet_name, mine, dict(mine, **fields))
+                        dirty = True
+
+                # Rows that were on the tab but have been deleted from it
+                for mine in stored:
+                    if (mine['row_number'] not in seen and mine['sheet_row'] is not None
+                            and mine['reservation_id'] not in unwritten
+                            and mine['row_number'] not in queued):
+                        conn.execute("DELETE FROM reservations WHERE date = ? AND row_number = ?",
+                                     (sheet_name, mine['row_number']))
+                        self._adjust_occupancy(conn, sheet_name, mine, None)
+                        dirty = True
+
+                if dirty:
+                    changed.append(sheet_name)
+            conn.commit()
+
+        for sheet_name in changed:
+            publish_reservation_event(sheet_name, 'refresh', {})
+        return changed
+
+    @staticmethod
+    def _adjust_occupancy(conn, sheet_name, before, after):
+        """Move a row's seats in slot_occupancy as it is added, edited or removed"""
+        for reservation, sign in ((before, -1), (after, 1)):
+            if reservation and is_active_status(reservation['confirmed']):
+                _adjust_slot(conn, sheet_name, reservation['time'],
+                             sign * party_seats(reservation['people']), sign)
+
+    def forget(self, sheet_names):
+        marks = ", ".join('?' * len(sheet_names))
+        with closing(state_db()) as conn, conn:
+            for table in ('reservations', 'reservation_import', 'sheet_mirror'):
+                conn.execute(f"DELETE FROM {table} WHERE date IN ({marks})", list(sheet_names))
+        self._imported.difference_update(sheet_names)
+
+
+if RESERVATION_STORE == 'sheets':
+    reservation_store = SheetsReservationStore()
+else:
+    reservation_store = SQLiteReservationStore()
+    reservation_store.init()
+
+
+# =============================================================================
+# SLOT CAPACITY
+# =============================================================================
+
+# Bookable times offered by index.html
+BOOKING_TIMES = ["12:00", "12:30", "13:00", "13:30", "18:00",
+                 "18:30", "19:00", "19:30", "20:00", "20:30"]
+# Dish type values offered by index.html, echoed on reservation_success.html
+DISH_TYPES = ["大火锅", "小火锅", "炒菜"]
+# Seats per time slot; SLOT_CAPACITIES overrides single slots, e.g. '{"19:00": 60}'
+SLOT_CAPACITY = int(os.environ.get('SLOT_CAPACITY', 40))
+SLOT_CAPACITIES = json.loads(os.environ.get('SLOT_CAPACITIES', '{}'))
+CANCELLED_STATUSES = {'cancelled', 'no'}
+
+
+def init_slot_occupancy():
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS slot_occupancy (
+                date TEXT NOT NULL,
+                time TEXT NOT NULL,
+                seats INTEGER NOT NULL DEFAULT 0,
+                bookings INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (date, time)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS slot_seeded (
+                date TEXT PRIMARY KEY,
+                seeded_at TEXT NOT NULL
+            )
+        """)
+
+
+def party_seats(people):
+    """Seats a party takes: the top of a "3-4" style range, "10+" counts as 10"""
+    numbers = [int(n) for n in re.findall(r'\d+', str(people or ''))]
+    return max(numbers) if numbers else 1
+
+
+def slot_capacity(time):
+    return int(SLOT_CAPACITIES.get(time, SLOT_CAPACITY))
+
+
+def is_active_status(status):
+    return str(status or '').strip().lower() not in CANCELLED_STATUSES
+
+
+def seed_slot_occupancy(conn, sheet_name, reservations):
+    """
+    Build a date's occupancy from its reservations plus, when the store
+    can't see them yet, bookings still waiting in the journal. Runs in the
+    caller's transaction and only for a date not seeded yet: once seeded,
+    occupancy is kept by deltas, and rebuilding it would erase seats that
+    reserve_slot took for bookings not yet in the store or journal.
+    """
+    if conn.execute("SELECT 1 FROM slot_seeded WHERE date = ?", (sheet_name,)).fetchone():
+        return
+    totals = {}
+
+    def count(time, people):
+        seats, bookings = totals.get(time, (0, 0))
+        totals[time] = (seats + party_seats(people), bookings + 1)
+
+    for reservation in reservations:
+        if is_active_status(reservation['confirmed']):
+            count(reservation['time'], reservation['people'])
+
+    pending = [] if reservation_store.includes_pending_writes else conn.execute(
+        "SELECT payload FROM reservation_journal WHERE date_written != 1")
+    for (payload,) in pending:
+        booking = json.loads(payload)
+        if str(booking['date']).replace('/', '-') == sheet_name:
+            count(booking['time'], booking['people'])
+    # Rows here can only be stray status deltas: no seats are taken before seeding
+    conn.execute("DELETE FROM slot_occupancy WHERE date = ?", (sheet_name,))
+    conn.executemany(
+        "INSERT INTO slot_occupancy (date, time, seats, bookings) VALUES (?, ?, ?, ?)",
+        [(sheet_name, t, seats, bookings) for t, (seats, bookings) in totals.items()])
+    conn.execute("INSERT INTO slot_seeded (date, seeded_at) VALUES (?, ?)",
+                 (sheet_name, datetime.now().isoformat()))
+
+
+def _unseeded_reservations(sheet_name):
+    """The date's reservations to seed from, or None if it's already seeded"""
+    with closing(state_db()) as conn:
+        seeded = conn.execute(
+            "SELECT 1 FROM slot_seeded WHERE date = ?", (sheet_name,)).fetchone()
+    return None if seeded else reservation_store.for_date(sheet_name)
+
+
+def _ensure_slots_seeded(sheet_name):
+    reservations = _unseeded_reservations(sheet_name)
+    if reservations is not None:
+        with closing(state_db()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            seed_slot_occupancy(conn, sheet_name, reservations)
+            conn.commit()
+
+
+def reserve_slot(date, time, people):
+    """
+    Atomically take seats in a slot if it has room (across all workers),
+    seeding the date in the same transaction if it's the first booking seen.
+    Returns False when the booking would exceed the slot's capacity.
+    """
+    sheet_name = str(date).replace('/', '-')
+    # Read outside the transaction: the store may itself write to state.db
+    reservations = _unseeded_reservations(sheet_name)
+    seats = party_seats(people)
+
+    with closing(state_db()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        if reservations is not None:
+            seed_slot_occupancy(conn, sheet_name, reservations)
+        row = conn.execute(
+            "SELECT seats FROM slot_occupancy WHERE date = ? AND time = ?",
+            (sheet_name, time)).fetchone()
+        if (row[0] if row else 0) + seats > slot_capacity(time):
+            conn.rollback()
+            return False
+        _adjust_slot(conn, sheet_name, time, seats, 1)
+        conn.commit()
+    return True
+
+
+def _adjust_slot(conn, sheet_name, time, seats, bookings):
+    conn.execute(
+        "INSERT INTO slot_occupancy (date, time, seats, bookings) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT (date, time) DO UPDATE SET "
+        "seats = MAX(0, seats + excluded.seats), bookings = MAX(0, bookings + excluded.bookings)",
+        (sheet_name, time, seats, bookings))
+
+
+def release_slot(date, time, people):
+    """Give back a booking's seats (e.g. the journal write failed)"""
+    with closing(state_db()) as conn, conn:
+        _adjust_slot(conn, str(date).replace('/', '-'), time, -party_seats(people), -1)
+
+
+def sync_slot_for_status(sheet_name, reservation, new_status):
+    """Keep occupancy in step with a reservation (as it was) changing status"""
+    was_active = is_active_status(reservation['confirmed'])
+    now_active = is_active_status(new_status)
+    if was_active == now_active:
+        return
+
+    seats = party_seats(reservation['people'])
+    with closing(state_db()) as conn, conn:
+        if now_active:
+            _adjust_slot(conn, sheet_name, reservation['time'], seats, 1)
+        else:
+            _adjust_slot(conn, sheet_name, reservation['time'], -seats, -1)
+
+
+def change_reservations(sheet_name, changes, event_kind):
+    """
+    Apply {row_number: fields} to one date through the store, keep slot
+    occupancy in step and tell open dashboards
+    """
+    previous = reservation_store.update_rows(sheet_name, changes)
+    for row_number, fields in changes.items():
+        if 'confirmed' in fields and row_number in previous:
+            sync_slot_for_status(sheet_name, previous[row_number], fields['confirmed'])
+    publish_reservation_events(sheet_name, event_kind, [
+        dict(fields, row_number=row_number) for row_number, fields in changes.items()])
+    return previous
+
+
+def slot_availability(date):
+    """Per-slot capacity, seats booked and seats left for a date"""
+    sheet_name = str(date).replace('/', '-')
+    _ensure_slots_seeded(sheet_name)
+    with closing(state_db()) as conn:
+        occupancy = dict(conn.execute(
+            "SELECT time, seats FROM slot_occupancy WHERE date = ?", (sheet_name,)).fetchall())
+
+    slots = []
+    for time in BOOKING_TIMES:
+        capacity = slot_capacity(time)
+        booked = occupancy.get(time, 0)
+        slots.append({
+            'time': time,
+            'capacity': capacity,
+            'booked': booked,
+            'remaining': max(0, capacity - booked),
+        })
+    return slots
+
+
+init_slot_occupancy()
+
+date_indexes_warmed_at = None
+
+
+def warm_date_indexes():
+    """
+    Load every date in the upcoming window into the reservation store (one
+    batched Sheets read at most) and seed slot occupancy for dates that
+    have none yet
+    """
+    try:
+        start, end = phone_index.window()
+        window = []
+        day = start
+        while day <= end:
+            window.append(day.strftime('%Y-%m-%d'))
+            day += timedelta(days=1)
+
+        loaded = reservation_store.warm(window)
+        with closing(state_db()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for title in window:
+                seed_slot_occupancy(conn, title, loaded[title])
+            conn.commit()
+        print(f"Date indexes warmed: {sum(len(r) for r in loaded.values())} reservation(s) "
+              f"across {len(window)} date(s)")
+        return True
+    except Exception as e:
+        print(f"Date index warm-up failed: {e}")
+        return False
+
+
+BACKEND_WARMUP_MAX_DELAY = float(os.environ.get('BACKEND_WARMUP_MAX_DELAY', 60))
+
+
+def warm_backends():
+    """Connect to Google and load the date indexes, retrying until both succeed"""
+    global date_indexes_warmed_at
+    delay = 1
+    while True:
+        try:
+            sheet.get()
+            if warm_date_indexes():
+                date_indexes_warmed_at = datetime.now().isoformat()
+                if scheduler_active():
+                    # Catch up on tabs the nightly run missed while we were down
+                    scheduler.modify_job('provision_date_sheets', next_run_time=datetime.now(sydney_tz))
+                    scheduler.add_job(resume_sms_runs, id='resume_sms_runs', replace_existing=True)
+                    scheduler.modify_job('schedule_reminders', next_run_time=datetime.now(sydney_tz))
+                return
+        except Exception as e:
+            print(f"Google Sheets not reachable yet, retrying in {delay:.0f}s: {e}")
+        sleep(delay)
+        delay = min(delay * 2, BACKEND_WARMUP_MAX_DELAY)
+
+
+threading.Thread(target=warm_backends, name='backend-warmup', daemon=True).start()
+
+
+def _final_journal_flush():
+    try:
+        flush_reservation_journal()
+    except Exception as e:
+        print(f"Final journal flush failed, entries will replay on restart: {e}")
+
+
+atexit.register(_final_journal_flush)
+
+
+# =============================================================================
+# SUBMISSION GUARDS (rate limit, idempotency, repeat bookings)
+# =============================================================================
+# Checked before a booking touches Sheets, the slot table or the email queue.
+# Rate limits are per worker, like the Sheets quota lanes; submission claims
+# live in state.db so a double-click split across workers is still caught.
+SUBMIT_RATE_PER_MINUTE = float(os.environ.get('SUBMIT_RATE_PER_MINUTE', 6))
+SUBMIT_BURST = float(os.environ.get('SUBMIT_BURST', 3))
+SUBMIT_RATE_CLIENTS = int(os.environ.get('SUBMIT_RATE_CLIENTS', 4096))
+# How long a form's idempotency key, and a (phone, date, time), stay claimed
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))
+BOOKING_FINGERPRINT_TTL = int(os.environ.get('BOOKING_FINGERPRINT_TTL', 600))
+# A claim with no booking after this long belongs to a request that died
+SUBMISSION_CLAIM_TIMEOUT = int(os.environ.get('SUBMISSION_CLAIM_TIMEOUT', 60))
+# How long a repeat waits for the first request's booking before giving up
+SUBMISSION_WAIT = float(os.environ.get('SUBMISSION_WAIT', 5))
+
+
+class ClientRateLimiter:
+    """A TokenBucket per client address; the least recently seen are evicted"""
+
+    def __init__(self, rate_per_minute, burst, max_clients):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, client):
+        """0 if `client` may go ahead, else the seconds until it may"""
+        with self._lock:
+            bucket = self._buckets.pop(client, None)
+            if bucket is None:
+                bucket = TokenBucket(self.rate_per_minute, self.burst)
+            self._buckets[client] = bucket
+            while len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        return bucket.try_acquire()
+
+
+submit_limiter = ClientRateLimiter(SUBMIT_RATE_PER_MINUTE, SUBMIT_BURST, SUBMIT_RATE_CLIENTS)
+
+
+def init_submission_claims():
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS submission_claims (
+                key TEXT PRIMARY KEY,
+                reservation TEXT,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS submission_claims_expires "
+                     "ON submission_claims (expires_at)")
+
+
+def submission_keys(idempotency_key, phone, date, time):
+    """
+    Claim keys for a submission with their TTLs. The form's key is scoped to
+    the phone so two guests can never share a booking through one key.
+    """
+    keys = {f"booking:{phone}|{date}|{time}": BOOKING_FINGERPRINT_TTL}
+    if idempotency_key:
+        keys[f"form:{idempotency_key[:64]}|{phone}"] = IDEMPOTENCY_KEY_TTL
+    return keys
+
+
+def claim_submission(keys):
+    """
+    Claim every key for a new booking in one transaction.
+    Returns (True, None) when claimed. Otherwise returns (False, reservation),
+    where reservation is the ID of the booking an earlier claim made, or None
+    if that booking is still in progress.
+    """
+    now = datetime.now().timestamp()
+    with closing(state_db()) as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("DELETE FROM submission_claims WHERE expires_at < ? "
+                     "OR (reservation IS NULL AND created_at < ?)",
+                     (now, now - SUBMISSION_CLAIM_TIMEOUT))
+        held = conn.execute(
+            "SELECT reservation FROM submission_claims WHERE key IN ("
+            + ", ".join('?' * len(keys)) + ") ORDER BY reservation IS NULL",
+            list(keys)).fetchone()
+        if held:
+            conn.rollback()
+            return False, held[0]
+        conn.executemany(
+            "INSERT INTO submission_claims (key, created_at, expires_at) VALUES (?, ?, ?)",
+            [(key, now, now + ttl) for key, ttl in keys.items()])
+        conn.commit()
+    return True, None
+
+
+def wait_for_claimed_booking(keys):
+    """The booking ID an in-progress claim made, polling up to SUBMISSION_WAIT seconds"""
+    deadline = monotonic() + SUBMISSION_WAIT
+    while True:
+        with closing(state_db()) as conn:
+            row = conn.execute(
+                "SELECT reservation FROM submission_claims WHERE key IN ("
+                + ", ".join('?' * len(keys)) + ") AND reservation IS NOT NULL",
+                list(keys)).fetchone()
+        if row or monotonic() >= deadline:
+            return row[0] if row else None
+        sleep(0.2)
+
+
+def complete_submission(keys, reservation_id):
+    """Attach the booking's ID to its claims so repeats are told it exists"""
+    with closing(state_db()) as conn, conn:
+        conn.executemany("UPDATE submission_claims SET reservation = ? WHERE key = ?",
+                         [(reservation_id, key) for key in keys])
+
+
+def release_submission(keys):
+    """Drop the claims of a submission that made no booking, so a retry can"""
+    with closing(state_db()) as conn, conn:
+        conn.executemany("DELETE FROM submission_claims WHERE key = ? AND reservation IS NULL",
+                         [(key,) for key in keys])
+
+
+init_submission_claims()
+
+
+# =============================================================================
+# CHANGE FEED (row-level events for the live dashboard)
+# =============================================================================
+# Events live in state.db so every worker's dashboard streams see writes made
+# by any other worker; a condition wakes local streams without waiting a poll.
+CHANGE_FEED_POLL_INTERVAL = float(os.environ.get('CHANGE_FEED_POLL_INTERVAL', 1))
+CHANGE_FEED_HEARTBEAT = int(os.environ.get('CHANGE_FEED_HEARTBEAT', 15))
+# Each open stream holds a worker thread (gunicorn.conf.py runs threaded
+# workers). Streams end after this long and the browser reconnects with
+# Last-Event-ID, so dropped connections don't linger.
+CHANGE_FEED_STREAM_SECONDS = int(os.environ.get('CHANGE_FEED_STREAM_SECONDS', 55))
+# Streams one worker holds open at once, kept below its gunicorn threads so
+# bookings and SMS webhooks always have threads. Dashboards over the limit
+# get the events they missed and reconnect after CHANGE_FEED_BUSY_RETRY.
+CHANGE_FEED_MAX_STREAMS = int(os.environ.get('CHANGE_FEED_MAX_STREAMS', 8))
+CHANGE_FEED_BUSY_RETRY = int(os.environ.get('CHANGE_FEED_BUSY_RETRY', 15))
+CHANGE_FEED_RETENTION_HOURS = int(os.environ.get('CHANGE_FEED_RETENTION_HOURS', 24))
+
+_change_feed_cond = threading.Condition()
+_open_streams = 0
+
+
+def init_change_feed():
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS reservation_events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                date TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS reservation_events_date ON reservation_events (date, id)")
+
+
+def publish_reservation_events(sheet_name, kind, payloads):
+    """
+    Record changes to a date sheet for /staff/api/stream in one transaction.
+    `kind` is 'reservation' (new row), 'status', 'sms_reply' or 'refresh'
+    (reload). Never raises: a missed event only costs a dashboard a reload.
+    """
+    now = datetime.now()
+    try:
+        with closing(state_db()) as conn, conn:
+            before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM reservation_events").fetchone()[0]
+            conn.executemany(
+                "INSERT INTO reservation_events (date, kind, payload, created_at) VALUES (?, ?, ?, ?)",
+                [(sheet_name, kind, json.dumps(p), now.isoformat()) for p in payloads])
+            if before // 500 != (before + len(payloads)) // 500:
+                cutoff = now - timedelta(hours=CHANGE_FEED_RETENTION_HOURS)
+                conn.execute("DELETE FROM reservation_events WHERE created_at < ?",
+                             (cutoff.isoformat(),))
+    except sqlite3.Error as e:
+        print(f"Could not record {kind} event for {sheet_name}: {e}")
+        return
+    with _change_feed_cond:
+        _change_feed_cond.notify_all()
+
+
+def publish_reservation_event(sheet_name, kind, payload):
+    publish_reservation_events(sheet_name, kind, [payload])
+
+
+def latest_event_id(sheet_name):
+    with closing(state_db()) as conn:
+        row = conn.execute(
+            "SELECT MAX(id) FROM reservation_events WHERE date = ?", (sheet_name,)).fetchone()
+    return row[0] or 0
+
+
+def reservation_events_since(sheet_name, last_id):
+    with closing(state_db()) as conn:
+        return conn.execute(
+            "SELECT id, kind, payload FROM reservation_events WHERE date = ? AND id > ? ORDER BY id",
+            (sheet_name, last_id)).fetchall()
+
+
+def change_feed_stream(sheet_name, last_id):
+    """Generator of SSE frames for one date, starting after event `last_id`"""
+    global _open_streams
+    with _change_feed_cond:
+        held = _open_streams < CHANGE_FEED_MAX_STREAMS
+        if held:
+            _open_streams += 1
+    if not held:
+        # No thread to spare: catch up and have the browser poll back later
+        yield f"retry: {CHANGE_FEED_BUSY_RETRY * 1000}\n\n"
+        for event_id, kind, payload in reservation_events_since(sheet_name, last_id):
+            yield f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+        return
+
+    try:
+        yield f"retry: {int(CHANGE_FEED_POLL_INTERVAL * 1000) + 1000}\n\n"
+        started = last_sent = monotonic()
+        while monotonic() - started < CHANGE_FEED_STREAM_SECONDS:
+            events = reservation_events_since(sheet_name, last_id)
+            for event_id, kind, payload in events:
+                yield f"id: {event_id}\nevent: {kind}\ndata: {payload}\n\n"
+                last_id = event_id
+                last_sent = monotonic()
+            if monotonic() - last_sent >= CHANGE_FEED_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = monotonic()
+            with _change_feed_cond:
+                _change_feed_cond.wait(CHANGE_FEED_POLL_INTERVAL)
+    finally:
+        with _change_feed_cond:
+            _open_streams -= 1
+
+
+init_change_feed()
+
+
+# =============================================================================
+# ARCHIVE (old date tabs and Master Data rows)
+# =============================================================================
+# Date tabs and Master Data rows older than ARCHIVE_AFTER_DAYS move out of the
+# spreadsheet into gzipped JSON under STATE_DIR/archive/<year>/<date>.json.gz,
+# one file per date, so the hot spreadsheet stays small. 0 turns it off.
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_DIR = os.path.join(STATE_DIR, 'archive')
+ARCHIVE_INDEX = os.path.join(ARCHIVE_DIR, 'index.json')
+# Date tabs read per values_batch_get call
+ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 50))
+
+
+def is_date_title(title):
+    try:
+        datetime.strptime(title, '%Y-%m-%d')
+        return True
+    except (TypeError, ValueError):
+        return False
+
+
+def _archive_path(date):
+    return os.path.join(ARCHIVE_DIR, date[:4], f'{date}.json.gz')
+
+
+def _write_durably(path, data):
+    """Atomically replace `path`, fsynced before the spreadsheet copy is deleted"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_archive_index():
+    """{'dates': [...], 'max_reservation_id': n} for everything archived so far"""
     try:
-        print(f"Attempting to send email to {customer_email}...")
+        with open(ARCHIVE_INDEX) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'dates': [], 'max_reservation_id': 0}
 
-        try:
-            date_obj = datetime.strptime(reservation_details['date'], '%Y-%m-%d')
-            formatted_date = date_obj.strftime('%A, %B %d, %Y')
-        except:
-            formatted_date = reservation_details['date']
 
-        subject = f"Booking Summary - {formatted_date} at {reservation_details['time']}"
+def load_archived_date(date):
+    """
+    The archive record for a date, or None:
+    {'date', 'archived_at', 'tab': rows, 'master_headers': [...], 'master': rows}
+    """
+    try:
+        with gzip.open(_archive_path(date), 'rt', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
 
-        text_body = f"""Dear {customer_name},
 
-Thank you for choosing JiuLongDing Chongqing Hotpot!
+def _archive_date(date, tab_rows, master_headers, master_rows):
+    """Merge into the date's archive file; a rerun after a partial failure only adds"""
+    record = load_archived_date(date) or {
+        'date': date, 'tab': [], 'master_headers': master_headers, 'master': []}
+    if tab_rows:
+        record['tab'] = tab_rows
+    known = {tuple(r) for r in record['master']}
+    record['master'] += [r for r in master_rows if tuple(r) not in known]
+    record['archived_at'] = datetime.now().isoformat()
+    _write_durably(_archive_path(date), gzip.compress(json.dumps(record).encode()))
+
+
+def _row_runs(row_numbers):
+    """Contiguous [first, last] runs of row numbers given in descending order"""
+    runs = []
+    for n in row_numbers:
+        if runs and runs[-1][0] == n + 1:
+            runs[-1][0] = n
+        else:
+            runs.append([n, n])
+    return runs
 
-RESERVATION SUMMARY
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📅 Date: {formatted_date}
-🕐 Time: {reservation_details['time']}
-👥 People: {reservation_details['people']} people
-🍲 Dish Type: {reservation_details.get('dish_type', 'Not specified')}
-📞 Contact: {reservation_details['phone']}
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-🏢 RESTAURANT LOCATION
-JiuLongDing Chongqing Hotpot (九龙鼎重庆火锅)
-📍 71 Dixon Street (up the stairs)
-    Haymarket, Sydney NSW 2000
-📞 Phone: +61 423 987 048
+def archive_old_reservations():
+    """
+    Move date tabs and Master Data rows older than ARCHIVE_AFTER_DAYS into the
+    local archive, then delete them from the spreadsheet with one batchUpdate.
+    Holds the journal lock so no append lands while rows are being removed.
+    Returns the archived dates.
+    """
+    if ARCHIVE_AFTER_DAYS <= 0:
+        return []
+    cutoff = (datetime.now(sydney_tz).date()
+              - timedelta(days=ARCHIVE_AFTER_DAYS)).strftime('%Y-%m-%d')
+
+    with try_process_lock('journal') as acquired:
+        if not acquired:
+            print("Archive skipped: the journal is being flushed")
+            return []
+
+        # Write out anything pending so the sheet matches the record
+        with closing(state_db()) as conn:
+            _flush_journal_entries(conn)
+            reservation_store.flush_mirror(conn)
+
+        titles = sorted(t for t in worksheet_titles() if is_date_title(t) and t < cutoff)
+        master_values = sheet.get_all_values()
+        old_master = {}  # date -> [(row_number, row)]
+        for row_number, row in enumerate(master_values[1:], start=2):
+            day = row[2] if len(row) > 2 else ''  # Column C: Date
+            if is_date_title(day) and day < cutoff:
+                old_master.setdefault(day, []).append((row_number, row))
+        dates = sorted(set(titles) | set(old_master))
+        if not dates:
+            return []
+
+        tabs = {}
+        for i in range(0, len(titles), ARCHIVE_BATCH_SIZE):
+            chunk = titles[i:i + ARCHIVE_BATCH_SIZE]
+            response = spreadsheet.values_batch_get([f"'{t}'!A:L" for t in chunk])
+            for title, value_range in zip(chunk, response.get('valueRanges', [])):
+                tabs[title] = value_range.get('values', [])
+
+        index = read_archive_index()
+        max_id = index.get('max_reservation_id', 0)
+        master_headers = master_values[0] if master_values else []
+        for date in dates:
+            master_rows = [row for _, row in old_master.get(date, [])]
+            _archive_date(date, tabs.get(date), master_headers, master_rows)
+            max_id = max([max_id] + [int(r[0]) for r in master_rows if str(r[0]).isdigit()])
+        _write_durably(ARCHIVE_INDEX, json.dumps({
+            'dates': sorted(set(index.get('dates', [])) | set(dates)),
+            'max_reservation_id': max_id,
+        }).encode())
+
+        delete_requests = [{'deleteSheet': {'sheetId': get_worksheet(t).id}} for t in titles]
+        # Bottom-up, so each deletion leaves the row numbers above it valid
+        master_row_numbers = sorted((n for rows in old_master.values() for n, _ in rows), reverse=True)
+        for first, last in _row_runs(master_row_numbers):
+            delete_requests.append({'deleteDimension': {'range': {
+                'sheetId': sheet.id, 'dimension': 'ROWS',
+                'startIndex': first - 1, 'endIndex': last}}})
+        # Never resent (structure_update): if a timed-out attempt landed, the rows
+        # have shifted and the same ranges now hold live bookings. The next run
+        # re-reads Master Data and deletes only what is still old.
+        spreadsheet.batch_update({'requests': delete_requests})
+
+        with _worksheets_lock:
+            _refresh_worksheets()
+        reservation_store.forget(dates)
+
+    print(f"Archived {len(titles)} date tab(s) and {len(master_row_numbers)} "
+          f"Master Data row(s) from before {cutoff}")
+    return dates
+
+
+@app.cli.command('archive')
+def archive_command():
+    """Archive date tabs and Master Data rows older than ARCHIVE_AFTER_DAYS"""
+    dates = archive_old_reservations()
+    print(f"Archived {len(dates)} date(s) to {ARCHIVE_DIR}")
 
 
-⚠️ IMPORTANT REMINDERS
-• Please arrive on time - we hold tables for 15 minutes
-• To cancel or make changes, please call us at +61 423 987 048 with your name and date of reservation
+# =============================================================================
+# STATIC ASSETS (fingerprinted, precompressed)
+# =============================================================================
+# Stylesheets, fonts and icons are copied to static/build/ under content-hashed
+# names with .gz/.br siblings, and served from /assets/ with immutable caching.
+# Built by `flask build-assets` or in the background at startup; asset_url()
+# falls back to the plain /static/ URL until the build exists.
+ASSET_DIR = os.path.join(app.static_folder, 'build')
+ASSET_MANIFEST = os.path.join(ASSET_DIR, 'manifest.json')
+# Files the stylesheet references come first so it can point at their new names
+ASSET_SOURCES = ['fonts/EBGaramond-VariableFont_wght.ttf', 'photos/IMG_20210306_194151.jpg',
+                 'css/styles.css', 'favicon.ico']
+# Templates whose text is drawn with the subset fonts
+FONT_SUBSET_TEMPLATES = ['index.html', 'reservation_success.html']
+# Code point ranges kept besides the template text, for text the templates
+# echo back: ASCII, Latin-1 and Latin Extended-A, the Vietnamese letters
+# (U+01A0-01B0, U+1EA0-1EFF) and dashes/quotes. Other user-entered text
+# (other scripts, emoji, combining marks) is out of scope and falls back to
+# system fonts, as do characters the font has no glyph for (e.g. CJK).
+FONT_SUBSET_RANGES = [(0x20, 0x7f), (0xa0, 0x180), (0x1a0, 0x1b1),
+                      (0x1ea0, 0x1f00), (0x2010, 0x2028)]
+COMPRESSIBLE_TYPES = {'text/html', 'text/css', 'text/plain', 'application/json',
+                      'application/javascript', 'image/svg+xml', 'image/x-icon',
+                      'image/vnd.microsoft.icon', 'font/ttf'}
+# Dynamic responses smaller than this aren't worth compressing
+COMPRESS_MIN_BYTES = 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+_asset_manifest = {}
+_asset_manifest_mtime = None
+
+
+def _read_manifest(path, current, current_mtime):
+    """(manifest, mtime) for a build manifest, re-read only when it changed"""
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return current, current_mtime
+    if mtime != current_mtime:
+        try:
+            with open(path) as f:
+                return json.load(f), mtime
+        except (OSError, ValueError) as e:
+            print(f"Could not read {os.path.basename(path)}: {e}")
+    return current, current_mtime
 
-Warm regards,
-The JiuLongDing Team
-九龙鼎重庆火锅
 
----
-This is an automated reservation summary."""
+def _write_atomic(path, data):
+    with open(f"{path}.tmp", 'wb') as f:
+        f.write(data)
+    os.replace(f"{path}.tmp", path)
 
-        response = requests.post(
-            "https://api.resend.com/emails",
-            headers={"Authorization": f"Bearer {os.environ.get('RESEND_API_KEY')}"},
-            json={
-                "from": "JLD Hotpot <reservations@jiulongding.com.au>",
-                "to": [customer_email],
-                "subject": subject,
-                "text": text_body
-            },
-            timeout=10
-        )
-        if response.status_code != 200:
-            print(f"Resend error {response.status_code}: {response.text}")
-            return False
 
-        print(
-            f"Confirmation email sent to {customer_email} )")
-        return True
+def load_asset_manifest():
+    """{'key': build key, 'assets': {source: built name}}"""
+    global _asset_manifest, _asset_manifest_mtime
+    _asset_manifest, _asset_manifest_mtime = _read_manifest(
+        ASSET_MANIFEST, _asset_manifest, _asset_manifest_mtime)
+    return _asset_manifest
 
-    except Exception as e:
-        print(f"Error sending email to {customer_email}: {e}")
-        import traceback
-        traceback.print_exc()
-        return False
 
+def _asset_build_key():
+    """Changes whenever a source, a font template, the glyph set or an optional encoder does"""
+    parts = [str(brotli is not None), str(font_subset is not None),
+             repr(FONT_SUBSET_RANGES), ''.join(BOOKING_TIMES + DISH_TYPES)]
+    for name in ASSET_SOURCES + [os.path.join(app.template_folder, t) for t in FONT_SUBSET_TEMPLATES]:
+        path = os.path.join(app.static_folder if name in ASSET_SOURCES else app.root_path, name)
+        try:
+            stat = os.stat(path)
+            parts.append(f"{name}:{stat.st_size}:{stat.st_mtime_ns}")
+        except OSError:
+            parts.append(f"{name}:missing")
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
 
-def send_email_async(email, name, reservation_data):
-    """Send email in background - separate function"""
-    try:
-        email_sent = send_confirmation_email(email, name, reservation_data)
-        if email_sent:
-            print(f"✅ Background email sent successfully to {email}")
-        else:
-            print(f"❌ Background email failed for {email}")
-    except Exception as e:
-        print(f"❌ Background email error: {str(e)}")
 
+def _fingerprinted(source, data):
+    stem, ext = os.path.splitext(source)
+    return f"{stem}.{hashlib.sha1(data).hexdigest()[:10]}{ext}"
 
-def create_date_sheet(name, phone, email, people, date, time, dish_type, notes, reservation_id):
-    """Create a new sheet for the date and add booking details"""
-    try:
-        sheet_name = str(date).replace('/', '-')
 
-        date_sheet = None
-        try:
-            date_sheet = spreadsheet.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            date_sheet = spreadsheet.add_worksheet(
-                title=sheet_name, rows="100", cols="11")
-            headers = ["Name", "Time", "People", "Phone", "Email",  "Date",
-                       "Dish Type", "Notes", "Confirmed", "Reservation ID", "SMS Reply", "Confirmation Method"]
-            date_sheet.append_row(headers)
-            date_sheet.format("A1:L1", {
-                "textFormat": {"bold": True},
-                "backgroundColor": {"red": 0.2, "green": 0.6, "blue": 0.9}
-            })
+def template_glyphs():
+    """
+    Every character the font-using templates can render: their source text,
+    FONT_SUBSET_RANGES and the booking constants they are filled in with
+    """
+    text = ''.join(chr(c) for start, end in FONT_SUBSET_RANGES for c in range(start, end))
+    text += ''.join(BOOKING_TIMES) + ''.join(DISH_TYPES)
+    for name in FONT_SUBSET_TEMPLATES:
+        with open(os.path.join(app.root_path, app.template_folder, name), encoding='utf-8') as f:
+            text += f.read()
+    return ''.join(sorted(set(text)))
+
+
+def _subset_font(path):
+    """WOFF2 (or TTF without brotli) bytes holding only the template glyphs"""
+    options = font_subset.Options()
+    options.flavor = 'woff2' if brotli is not None else None
+    options.layout_features = ['*']
+    font = font_subset.load_font(path, options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(text=template_glyphs())
+    subsetter.subset(font)
+    out = BytesIO()
+    font_subset.save_font(font, out, options)
+    return out.getvalue(), '.woff2' if options.flavor else '.ttf'
+
+
+CSS_URL_PATTERN = re.compile(
+    r"url\((['\"]?)([^)'\"]+)\1\)(\s*format\((['\"])[^)'\"]+\4\))?")
+FONT_FORMATS = {'.woff2': 'woff2', '.ttf': 'truetype', '.woff': 'woff'}
+
+
+def _rewrite_css_urls(source, css, built):
+    """
+    Point url() references in a stylesheet at already built assets, and
+    anything else back at /static/ since the stylesheet moves to /assets/.
+    """
+    base = os.path.dirname(source)
 
-        date_sheet.append_row([name, time, people, phone, email, date,
-                              dish_type, notes, "Pending", reservation_id or ""])
+    def replace(match):
+        if re.match(r'(?:[a-z]+:|/)', match.group(2)):
+            return match.group(0)
+        target = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, '/')
+        if target not in built:
+            return f"url({app.static_url_path}/{target}){match.group(3) or ''}"
+        new_url = os.path.relpath(built[target], base).replace(os.sep, '/')
+        fmt = match.group(3)
+        if fmt:
+            fmt = f" format('{FONT_FORMATS.get(os.path.splitext(new_url)[1], 'truetype')}')"
+        return f"url({new_url}){fmt or ''}"
 
-    except Exception as e:
-        print(f"Error creating/updating date sheet: {e}")
+    return CSS_URL_PATTERN.sub(replace, css)
 
 
-def send_sms(to_number, message_text, custom_ref=None):
-    """Send SMS using Mobile Message API"""
-    sender = "61485900180"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Basic {AUTH_HEADER}"
-    }
-    payload = {
-        "messages": [
-            {
-                "to": to_number,
-                "message": message_text,
-                "sender": sender
-            }
-        ]
-    }
-    if custom_ref:
-        payload["messages"][0]["custom_ref"] = custom_ref
-    print("DEBUG Payload:", json.dumps(payload, indent=2))
+def _precompress(path, data):
+    _write_atomic(f"{path}.gz", gzip.compress(data, 9))
+    if brotli is not None:
+        _write_atomic(f"{path}.br", brotli.compress(data, quality=11))
 
-    try:
-        response = requests.post(
-            API_URL, headers=headers, json=payload, timeout=10)
 
-        if response.status_code != 200:
-            print(f"Error {response.status_code}: {response.text}")
+def build_assets():
+    """
+    Fingerprint, subset and precompress ASSET_SOURCES into static/build/,
+    unless nothing changed since the last build. Returns the manifest, or
+    None if another process is building.
+    """
+    with try_process_lock('assets') as acquired:
+        if not acquired:
             return None
 
-        response_data = response.json()
-        print("SMS API Response:", json.dumps(response_data, indent=2))
-        return response_data
-    except Exception as e:
-        print(f"Error sending SMS: {e}")
-        return None
+        key = _asset_build_key()
+        manifest = load_asset_manifest()
+        if manifest.get('key') == key:
+            return manifest
 
+        built = {}
+        for source in ASSET_SOURCES:
+            path = os.path.join(app.static_folder, source)
+            try:
+                if source.endswith('.ttf') and font_subset is not None:
+                    data, ext = _subset_font(path)
+                    name_source = os.path.splitext(source)[0] + ext
+                else:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                    name_source = source
+                    if source.endswith('.css'):
+                        data = _rewrite_css_urls(source, data.decode('utf-8'), built).encode('utf-8')
+            except Exception as e:
+                print(f"Could not build asset {source}: {e}")
+                continue
 
-def send_sms_on_date(target_date, message_type="day_of"):
-    """Helper function to send SMS for any date"""
-    try:
-        sheet_name = target_date.replace('/', '-')
+            name = _fingerprinted(name_source, data)
+            out_path = os.path.join(ASSET_DIR, name)
+            if not os.path.exists(out_path):
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                _write_atomic(out_path, data)
+                if mimetypes.guess_type(name)[0] in COMPRESSIBLE_TYPES:
+                    _precompress(out_path, data)
+            built[source] = name
+
+        os.makedirs(ASSET_DIR, exist_ok=True)
+        _write_atomic(ASSET_MANIFEST, json.dumps(
+            {'key': key, 'assets': built}, indent=1, sort_keys=True).encode())
+        print(f"Built {len(built)} static asset(s)")
+        return load_asset_manifest()
+
+
+@app.template_global()
+def asset_url(filename):
+    """url_for('static', ...) replacement that prefers the fingerprinted build"""
+    built = load_asset_manifest().get('assets', {}).get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('asset', filename=built)
+
+
+@app.route("/assets/<path:filename>")
+def asset(filename):
+    """Serve a built asset, precompressed when the client accepts it"""
+    path = safe_join(ASSET_DIR, filename)
+    if path is None or filename.endswith('manifest.json') or not os.path.isfile(path):
+        abort(404)
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    for encoding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if request.accept_encodings[encoding] and os.path.isfile(path + suffix):
+            response = send_file(path + suffix, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
+            response.headers['Content-Encoding'] = encoding
+            break
+    else:
+        response = send_file(path, mimetype=mimetype, max_age=IMMUTABLE_MAX_AGE)
 
-        try:
-            date_sheet = spreadsheet.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            return f"No reservations found for {target_date}"
+    response.vary.add('Accept-Encoding')
+    response.cache_control.immutable = True
+    return response
 
-        all_data = date_sheet.get_all_values()
-        sent_count = 0
-        failed_count = 0
-        batch_updates = []
 
-        for i, row in enumerate(all_data[1:], start=2):
-            if len(row) < 10:
-                continue
-            name = row[0]
-            time = row[1]
-            people = row[2]
-            phone = row[3]
-            email = row[4]
-            date = row[5]
-            dish = row[6]
-            notes = row[7]
-            confirmed = row[8]
-            reservation_id = row[9]
-
-            if confirmed == "Pending" and phone:
-
-                sms_message = (
-                    f"Hi {name}! This is a reminder of your reservation today "
-                    f"at {time} for {people} people.\n"
-                    f"Reply Y to confirm or N to cancel.\n"
-                    f"Location: 71 Dixon St (up the stairs), Haymarket - JLD Hotpot"
-                )
+@app.after_request
+def compress_response(response):
+    """gzip rendered pages and JSON for clients that accept it"""
+    if (response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+            or not request.accept_encodings['gzip']):
+        return response
 
-                result = send_sms(phone, sms_message,
-                                  custom_ref=f"{message_type}_{datetime.now().timestamp()}")
+    data = response.get_data()
+    if len(data) < COMPRESS_MIN_BYTES:
+        return response
 
-                print(f"sms sent: {name}")
-                timestamp = datetime.now().strftime('%H:%M')
-                if result:
-                    sent_count += 1
+    response.set_data(gzip.compress(data, 6))
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)  # The bytes differ from the identity body
+    return response
 
-                    batch_updates.append({
-                        'range': f'K{i}',
-                        'values': [[f"{message_type} SMS sent {timestamp}"]]
-                    })
 
-                else:
-                    failed_count += 1
-                    batch_updates.append({
-                        'range': f'K{i}',
-                        'values': [[f"{message_type} SMS failed {timestamp}"]]
-                    })
+@app.cli.command('build-assets')
+def build_assets_command():
+    """Fingerprint, subset and precompress the static assets"""
+    build_assets()
 
-        if batch_updates:
-            date_sheet.batch_update(batch_updates)
-        return f"SMS Summary for {target_date}: {sent_count} sent successfully, {failed_count} failed"
 
+def _build_assets_background():
+    try:
+        build_assets()
     except Exception as e:
-        return f"Error sending SMS for {target_date}: {e}"
+        print(f"Asset build failed, serving plain static files: {e}")
+
 
+threading.Thread(target=_build_assets_background, name='asset-build', daemon=True).start()
+
+
+# =============================================================================
+# RESPONSIVE IMAGES
+# =============================================================================
+# Resized WebP/AVIF/JPEG copies of static photos, named by a hash of the
+# source bytes so they can be cached forever. Built by `flask build-images`
+# or in the background the first time a template asks for a photo.
+IMAGE_WIDTHS = [int(w) for w in os.environ.get('IMAGE_WIDTHS', '240,480,960').split(',')]
+IMAGE_QUALITY = {'avif': 50, 'webp': 72, 'jpeg': 78}
+DERIVED_DIR = os.path.join(ASSET_DIR, 'images')
+IMAGE_MANIFEST = os.path.join(DERIVED_DIR, 'manifest.json')
+
+# The jiugongge grid on index.html, and what `flask build-images` builds
+HOMEPAGE_PHOTOS = [f'photos/9gonggepng/img{i}.jpeg' for i in range(1, 9)] + [
+    'photos/9gonggepng/img9.PNG']
+# Each grid cell is a third of .about-photo, which is full width on phones
+HOMEPAGE_PHOTO_SIZES = '(max-width: 768px) 33vw, 18vw'
+
+_image_manifest = {}
+_image_manifest_mtime = None
+_image_attempted = set()  # Photos this process has already queued a build for
+_image_pending = set()
+_image_builder_thread = None
+_image_lock = threading.Lock()
+
+
+def image_formats():
+    """Formats this Pillow build can write, best first; JPEG is the <img> fallback"""
+    if Image is None:
+        return []
+    formats = ['avif'] if pil_features.check('avif') else []
+    if pil_features.check('webp'):
+        formats.append('webp')
+    return formats + ['jpeg']
+
+
+def load_image_manifest():
+    """The manifest on disk, re-read when another process rewrites it"""
+    global _image_manifest, _image_manifest_mtime
+    _image_manifest, _image_manifest_mtime = _read_manifest(
+        IMAGE_MANIFEST, _image_manifest, _image_manifest_mtime)
+    return _image_manifest
+
+
+def _build_derivatives(source, digest):
+    """Write every width/format of one photo; returns its manifest entry"""
+    stem = os.path.splitext(os.path.basename(source))[0].lower()
+    with Image.open(os.path.join(app.static_folder, source)) as original:
+        largest = max(IMAGE_WIDTHS)
+        original.draft('RGB', (largest, largest))  # JPEGs decode at reduced scale
+        image = ImageOps.exif_transpose(original).convert('RGB')
+
+    widths = sorted({min(w, image.width) for w in IMAGE_WIDTHS})
+    variants = {}
+    for fmt in image_formats():
+        variants[fmt] = []
+        for width in widths:
+            filename = f"{stem}-{digest}-{width}.{'jpg' if fmt == 'jpeg' else fmt}"
+            path = os.path.join(DERIVED_DIR, filename)
+            if not os.path.exists(path):
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), Image.LANCZOS)
+                resized.save(f"{path}.tmp", fmt.upper(), quality=IMAGE_QUALITY[fmt],
+                             **({'progressive': True, 'optimize': True} if fmt == 'jpeg' else {}))
+                os.replace(f"{path}.tmp", path)
+            variants[fmt].append([width, filename])
+
+    return {'hash': digest, 'width': image.width, 'height': image.height, 'variants': variants}
+
+
+def build_image_derivatives(sources):
+    """
+    Generate derivatives for static-relative photo paths that are missing or
+    changed. Returns the number of photos (re)built.
+    """
+    if Image is None:
+        print("Pillow is not installed; serving original photos")
+        return 0
+
+    with try_process_lock('images') as acquired:
+        if not acquired:
+            return 0  # Another worker is building
+
+        os.makedirs(DERIVED_DIR, exist_ok=True)
+        manifest = dict(load_image_manifest())
+        built = 0
+        for source in sources:
+            try:
+                with open(os.path.join(app.static_folder, source), 'rb') as f:
+                    digest = hashlib.sha1(f.read()).hexdigest()[:10]
+                entry = manifest.get(source)
+                if (entry and entry['hash'] == digest
+                        and set(entry['variants']) == set(image_formats())):
+                    continue
+                manifest[source] = _build_derivatives(source, digest)
+                built += 1
+                print(f"Built image derivatives for {source}")
+            except Exception as e:
+                print(f"Could not build derivatives for {source}: {e}")
+
+        if built:
+            _write_atomic(IMAGE_MANIFEST, json.dumps(manifest, indent=1, sort_keys=True).encode())
+            load_image_manifest()
+        return built
+
+
+def _start_image_build(source):
+    """Queue a photo for the background builder, once per process"""
+    global _image_builder_thread
+    with _image_lock:
+        if source in _image_attempted:
+            return
+        _image_attempted.add(source)
+        _image_pending.add(source)
+        if _image_builder_thread is None or not _image_builder_thread.is_alive():
+            _image_builder_thread = threading.Thread(
+                target=_image_builder, name='image-build', daemon=True)
+            _image_builder_thread.start()
+
+
+def _image_builder():
+    while True:
+        with _image_lock:
+            sources = sorted(_image_pending)
+            _image_pending.clear()
+        if not sources:
+            return
+        build_image_derivatives(sources)
+
+
+def _srcset(variants):
+    return ', '.join(
+        f"{url_for('asset', filename=f'images/{name}')} {width}w" for width, name in variants)
+
+
+@app.template_global()
+def responsive_image(source, alt, sizes='100vw', css_class=None):
+    """
+    <picture> with AVIF/WebP/JPEG srcsets for a static photo, lazy-loaded.
+    Until derivatives exist, the original file is served as a plain <img>.
+    """
+    class_attr = f' class="{escape(css_class)}"' if css_class else ''
+    entry = load_image_manifest().get(source)
+    if entry is None:
+        if Image is not None:
+            _start_image_build(source)
+        return Markup(
+            f'<img src="{url_for("static", filename=source)}" alt="{escape(alt)}"'
+            f'{class_attr} loading="lazy" decoding="async">')
+
+    variants = entry['variants']
+    sources = ''.join(
+        f'<source type="image/{fmt}" srcset="{_srcset(variants[fmt])}" sizes="{escape(sizes)}">'
+        for fmt in ('avif', 'webp') if fmt in variants)
+    jpeg = variants['jpeg']
+    return Markup(
+        f'<picture>{sources}'
+        f'<img src="{url_for("asset", filename=f"images/{jpeg[-1][1]}")}" '
+        f'srcset="{_srcset(jpeg)}" sizes="{escape(sizes)}" alt="{escape(alt)}"{class_attr} '
+        f'width="{entry["width"]}" height="{entry["height"]}" loading="lazy" decoding="async">'
+        f'</picture>')
+
+
+app.jinja_env.globals.update(homepage_photos=HOMEPAGE_PHOTOS,
+                             homepage_photo_sizes=HOMEPAGE_PHOTO_SIZES)
+
+
+@app.cli.command('build-images')
+def build_images_command():
+    """Generate responsive derivatives for the homepage photos"""
+    built = build_image_derivatives(HOMEPAGE_PHOTOS)
+    print(f"Built derivatives for {built} photo(s) in {DERIVED_DIR}")
 
 
 # CUSTOMER-FACING ROUTES
 
+def booking_form(error=None, status=200):
+    """The booking form, carrying a fresh idempotency key (so never cached)"""
+    response = make_response(render_template(
+        "index.html", error=error, idempotency_key=secrets.token_urlsafe(16)), status)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
 @app.route("/")
 def home():
     """Customer reservation form"""
     print("HOME PAGE LOADED")
-    return render_template("index.html")
+    return booking_form()
 
 
 @app.route("/submit_reservation", methods=["POST"])
@@ -438,6 +3898,14 @@ def submit_reservation_route():
     print("=== FORM SUBMITTED TO /submit_reservation ===")
     print(f"Form data received: {dict(request.form)}")
 
+    retry_after = submit_limiter.try_acquire(request.remote_addr)
+    if retry_after:
+        print(f"RATE LIMITED - {request.remote_addr}")
+        metrics.inc('booking_submissions_total', outcome='rate_limited')
+        response = booking_form("Too many booking attempts. Please wait a minute and try again.", 429)
+        response.headers['Retry-After'] = str(int(retry_after) + 1)
+        return response
+
     # Get form data
     name = request.form.get("name")
     email = request.form.get("email")
@@ -452,26 +3920,62 @@ def submit_reservation_route():
     if not name or not email or not phone or not people or not date or not time:
         error = "All fields are required. Please fill out the entire form."
         print("VALIDATION FAILED - Missing fields")
-        return render_template("index.html", error=error)
-
-    reservation_id = generate_reservation_id()
-    # save to master data sheet
-    sheet.append_row(
-        [reservation_id, name, date, time,  people, dish_type, phone, email, notes])
-
-    reservation_data = {
-        'name': name, 'phone': phone, 'email': email, 'people': people,
-        'date': date, 'time': time, 'dish_type': dish_type, 'notes': notes, 'reservation_id': reservation_id
-    }
-    # Create date-specific sheet
-    create_date_sheet(name, phone, email, people, date,
-                      time, dish_type, notes, reservation_id)
-
-    email_thread = threading.Thread(
-        target=send_email_async,
-        args=(email, name, reservation_data)
-    )
-    email_thread.start()
+        metrics.inc('booking_submissions_total', outcome='invalid')
+        return booking_form(error)
+
+    # A double-click, browser retry or resubmitted form is told the booking exists,
+    # without echoing the earlier booking's details back to whoever sent it
+    keys = submission_keys(request.form.get('idempotency_key'), phone, date, time)
+    claimed, earlier = claim_submission(keys)
+    if not claimed:
+        earlier = earlier or wait_for_claimed_booking(keys)
+        if earlier is None:
+            metrics.inc('booking_submissions_total', outcome='in_progress')
+            return booking_form("This booking is still being processed. "
+                                "Please wait a moment before trying again.", 409)
+        print(f"DUPLICATE - {phone} {date} {time} is reservation {earlier}")
+        metrics.inc('booking_submissions_total', outcome='duplicate')
+        session['last_reservation'] = {'already_booked': True, 'phone': phone,
+                                       'date': date, 'time': time}
+        return redirect(url_for('reservation_success'))
+
+    slot_reserved = False
+    try:
+        if not reserve_slot(date, time, people):
+            release_submission(keys)
+            error = f"Sorry, {time} on {date} is fully booked. Please choose another time."
+            print(f"SLOT FULL - {date} {time} for {people}")
+            metrics.inc('booking_submissions_total', outcome='full')
+            return booking_form(error)
+        slot_reserved = True
+
+        reservation_id = generate_reservation_id()
+
+        reservation_data = {
+            'name': name, 'phone': phone, 'email': email, 'people': people,
+            'date': date, 'time': time, 'dish_type': dish_type, 'notes': notes, 'reservation_id': reservation_id
+        }
+
+        # Record the booking; the journal flusher writes Master Data and the date sheet
+        try:
+            reservation_store.add(reservation_data)
+        except sqlite3.Error as e:
+            print(f"Journal unavailable, writing to Sheets directly: {e}")
+            sheet.append_row(
+                [reservation_id, name, date, time,  people, dish_type, phone, email, notes])
+            create_date_sheet(name, phone, email, people, date,
+                              time, dish_type, notes, reservation_id)
+    except Exception:
+        # No booking was recorded, so nothing may hold its seats or claims
+        if slot_reserved:
+            release_slot(date, time, people)
+        release_submission(keys)
+        raise
+
+    complete_submission(keys, reservation_data['reservation_id'])
+    metrics.inc('booking_submissions_total', outcome='booked')
+    schedule_reservation_reminder(reservation_data)
+    send_email_async(email, name, reservation_data)
 
     session['last_reservation'] = reservation_data
     return redirect(url_for('reservation_success'))
@@ -487,6 +3991,20 @@ def reservation_success():
     return render_template('reservation_success.html', **reservation_data)
 
 
+@app.route("/api/availability/<date>")
+def availability(date):
+    """Seats left per time slot, used by the booking form"""
+    try:
+        datetime.strptime(date, '%Y-%m-%d')
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Date must be YYYY-MM-DD'}), 400
+
+    try:
+        return jsonify({'success': True, 'date': date, 'slots': slot_availability(date)})
+    except Exception as e:
+        return jsonify({'success': False, 'message': f'Error loading availability: {str(e)}'}), 500
+
+
 # STAFF DASHBOARD ROUTES
 
 def require_staff_auth(f):
@@ -532,71 +4050,137 @@ def staff_dashboard():
 def get_reservations(date):
     try:
         sheet_name = date.replace('/', '-')
+        # Read before the rows so a stream resumed from here misses nothing
+        last_event_id = latest_event_id(sheet_name)
+        reservations = reservation_store.for_date(sheet_name)
 
-        try:
-            date_sheet = spreadsheet.worksheet(sheet_name)
-        except gspread.WorksheetNotFound:
-            return jsonify({
+        if not reservations:
+            body = {
                 'success': False,
                 'message': f'No reservations found for {date}',
-                'reservations': []
-            })
+                'reservations': [],
+                'last_event_id': last_event_id
+            }
+        else:
+            reservations.sort(key=reservation_sort_key)
+            body = {
+                'success': True,
+                'message': f'Found {len(reservations)} reservations for {date}',
+                'reservations': reservations,
+                'last_event_id': last_event_id,
+                **reservation_totals(reservations)
+            }
 
-        all_data = date_sheet.get_all_values()
+        response = jsonify(body)
+        response.set_etag(hashlib.sha1(
+            json.dumps(body, sort_keys=True).encode()).hexdigest())
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
 
-        if len(all_data) <= 1:
-            return jsonify({
-                'success': False,
-                'message': f'No reservations found for {date}',
-                'reservations': []
-            })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'Error loading reservations: {str(e)}',
+            'reservations': []
+        })
 
-        reservations = []
-        for i, row in enumerate(all_data[1:], start=2):
-            if len(row) >= 9:
-                reservation = {
-                    'row_number': i,
-                    'name': row[0] if len(row) > 0 else '',
-                    'time': row[1] if len(row) > 1 else '',
-                    'people': row[2] if len(row) > 2 else '',
-                    'phone': row[3] if len(row) > 3 else '',
-                    'email': row[4] if len(row) > 4 else '',
-                    'date': row[5] if len(row) > 5 else '',
-                    'dish_type': row[6] if len(row) > 6 else '',
-                    'notes': row[7] if len(row) > 7 else '',
-                    'confirmed': row[8] if len(row) > 8 else 'Pending',
-                    'reservation_id': row[9] if len(row) > 9 else ''
-                }
-                reservations.append(reservation)
-
-        # Sort by time
-        def parse_time(time_str):
-            try:
-                return datetime.strptime(time_str, '%H:%M').time()
-            except:
-                try:
-                    return datetime.strptime(time_str, '%I:%M %p').time()
-                except:
-                    return datetime.strptime('12:00', '%H:%M').time()
 
-        reservations.sort(key=lambda x: parse_time(x['time']))
+@app.route("/staff/api/stream/<date>")
+@require_staff_auth
+def stream_reservations(date):
+    """Server-Sent Events for one date; resumes from Last-Event-ID or ?since="""
+    sheet_name = date.replace('/', '-')
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    try:
+        last_id = int(since)
+    except (TypeError, ValueError):
+        last_id = latest_event_id(sheet_name)
+
+    return Response(change_feed_stream(sheet_name, last_id),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+MAX_RANGE_DAYS = 31
+
+
+@app.route("/staff/api/reservations/<start_date>/<end_date>")
+@require_staff_auth
+def get_reservations_range(start_date, end_date):
+    """Reservations for every date from start_date to end_date inclusive"""
+    try:
+        start = datetime.strptime(start_date, '%Y-%m-%d').date()
+        end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Dates must be YYYY-MM-DD', 'days': []}), 400
+
+    if end < start or (end - start).days >= MAX_RANGE_DAYS:
+        return jsonify({
+            'success': False,
+            'message': f'Range must be 1 to {MAX_RANGE_DAYS} days',
+            'days': []
+        }), 400
+
+    try:
+        dates = [(start + timedelta(days=i)).strftime('%Y-%m-%d')
+                 for i in range((end - start).days + 1)]
+        by_date = reservation_store.for_dates(dates)
+
+        days = []
+        for date in dates:
+            reservations = sorted(by_date.get(date, []), key=reservation_sort_key)
+            days.append({
+                'date': date,
+                'reservations': reservations,
+                **reservation_totals(reservations)
+            })
 
+        all_reservations = [r for day in days for r in day['reservations']]
         return jsonify({
             'success': True,
-            'message': f'Found {len(reservations)} reservations for {date}',
-            'reservations': reservations,
-            'total_confirmed': len([r for r in reservations if r['confirmed'].lower() in ['confirmed', 'yes']]),
-            'total_pending': len([r for r in reservations if r['confirmed'].lower() in ['pending', 'no', '']]),
-            'total_people': sum([int(r['people']) for r in reservations if r['people'].isdigit()])
+            'message': f'Found {len(all_reservations)} reservations from {start_date} to {end_date}',
+            'days': days,
+            **reservation_totals(all_reservations)
         })
 
     except Exception as e:
         return jsonify({
             'success': False,
             'message': f'Error loading reservations: {str(e)}',
-            'reservations': []
+            'days': []
         })
 
+
+@app.route("/staff/api/archive")
+@require_staff_auth
+def list_archived_dates():
+    """Dates whose reservations have been moved to the archive"""
+    return jsonify({'success': True, 'dates': read_archive_index()['dates']})
+
+
+@app.route("/staff/api/archive/<date>")
+@require_staff_auth
+def get_archived_reservations(date):
+    """Reservations and Master Data rows for an archived date"""
+    date = date.replace('/', '-')
+    if not is_date_title(date):
+        return jsonify({'success': False, 'message': 'Date must be YYYY-MM-DD', 'reservations': []}), 400
+    record = load_archived_date(date)
+    if record is None:
+        return jsonify({'success': False, 'message': f'No archive for {date}', 'reservations': []}), 404
+
+    reservations = sorted((parse_reservation_row(row, i)
+                           for i, row in enumerate(record['tab'][1:], start=2) if len(row) >= 9),
+                          key=reservation_sort_key)
+    return jsonify({
+        'success': True,
+        'message': f'Found {len(reservations)} archived reservations for {date}',
+        'archived_at': record['archived_at'],
+        'reservations': reservations,
+        'master_data': [dict(zip(record['master_headers'], row)) for row in record['master']],
+        **reservation_totals(reservations)
+    })
+
 # API to update status
 
 
@@ -610,10 +4194,7 @@ def update_reservation_status():
         new_status = data.get('status')
 
         sheet_name = date.replace('/', '-')
-        date_sheet = spreadsheet.worksheet(sheet_name)
-
-        # Update the confirmed status (column I = 9)
-        date_sheet.update_cell(row_number, 9, new_status)
+        change_reservations(sheet_name, {row_number: {'confirmed': new_status}}, 'status')
 
         return jsonify({
             'success': True,
@@ -689,6 +4270,22 @@ def send_tomorrow_confirmations():
     result = send_sms_on_date(tomorrow, message_type="day_before")
     return f"<h2>SMS Results for {tomorrow}</h2><p>{result}</p><a href='/admin'>← Back to Admin</a>"
 
+@app.route("/staff/api/sms-runs")
+@require_staff_auth
+def list_sms_runs():
+    """The most recent reminder runs and their progress"""
+    return jsonify({'success': True, 'runs': recent_sms_runs()})
+
+
+@app.route("/staff/api/sms-runs/<date>/<message_type>")
+@require_staff_auth
+def get_sms_run(date, message_type):
+    """Progress of one reminder run, reservation by reservation"""
+    run = sms_run_status(date.replace('/', '-'), message_type)
+    if run is None:
+        return jsonify({'success': False, 'message': f'No {message_type} SMS run for {date}'}), 404
+    return jsonify({'success': True, 'run': run})
+
 # =============================================================================
 # SMS REPLY ROUTES (WebHook)
 # =============================================================================
@@ -696,33 +4293,222 @@ def send_tomorrow_confirmations():
 
 @app.route('/sms-webhook', methods=['POST'])
 def receive_sms():
-    """Webhook endpoint to receive inbound SMS"""
+    """
+    Webhook endpoint to receive inbound SMS
+    Replies are queued durably and acknowledged straight away; the inbox
+    consumer applies them to the sheets in the background.
+    """
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         print("Received webhook data:", json.dumps(data, indent=2))
 
+        if not isinstance(data, dict) or not data.get('sender') or data.get('message') is None:
+            return jsonify({"status": "error", "message": "sender and message are required"}), 400
+
         sender = data.get('sender')
         message_text = data.get('message')
-        received_at = data.get('received_at')
-        original_custom_ref = data.get('original_custom_ref')
-
-        # Process the reply with date detection
-        success = process_sms_reply_smart(sender, message_text, received_at)
+        received_at = data.get('received_at') or datetime.utcnow().isoformat() + 'Z'
 
-        if success:
-            return jsonify({"status": "success"}), 200
-        else:
+        try:
+            queued = enqueue_sms_reply(data, sender, message_text, received_at)
+        except sqlite3.Error as e:
+            print(f"SMS inbox unavailable, processing inline: {e}")
+            success = process_sms_reply_smart(sender, message_text, received_at)
+            if success:
+                return jsonify({"status": "success"}), 200
             return jsonify({"status": "warning", "message": "No matching reservation"}), 200
 
+        return jsonify({"status": "queued" if queued else "duplicate"}), 200
+
     except Exception as e:
         print(f"Error processing webhook: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+# =============================================================================
+# SMS INBOX (durable queue behind /sms-webhook)
+# =============================================================================
+
+SMS_INBOX_BATCH_SIZE = int(os.environ.get('SMS_INBOX_BATCH_SIZE', 100))
+SMS_INBOX_MAX_ATTEMPTS = int(os.environ.get('SMS_INBOX_MAX_ATTEMPTS', 5))
+SMS_INBOX_POLL_INTERVAL = float(os.environ.get('SMS_INBOX_POLL_INTERVAL', 2))
+SMS_INBOX_MAX_BACKOFF = float(os.environ.get('SMS_INBOX_MAX_BACKOFF', 120))
+# After a wake-up, wait this long so a burst of replies shares one batch_update
+SMS_INBOX_BATCH_WINDOW = float(os.environ.get('SMS_INBOX_BATCH_WINDOW', 1))
+# Processed message ids are kept this long to reject provider retries
+SMS_INBOX_RETENTION_DAYS = int(os.environ.get('SMS_INBOX_RETENTION_DAYS', 7))
+
+_sms_inbox_wakeup = threading.Event()
+
+
+def init_sms_inbox():
+    with closing(state_db()) as conn, conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS sms_inbox (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                message_id TEXT NOT NULL UNIQUE,
+                sender TEXT NOT NULL,
+                message TEXT NOT NULL,
+                received_at TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                last_error TEXT,
+                created_at TEXT NOT NULL
+            )
+        """)
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS sms_inbox_status ON sms_inbox (status, seq)")
+
+
+def sms_message_id(data, sender, message, received_at):
+    """Provider message id, or a stable fingerprint when the payload has none"""
+    message_id = data.get('message_id') or data.get('id')
+    if message_id:
+        return str(message_id)
+    fingerprint = f"{sender}|{received_at}|{message}".encode()
+    return 'sha1:' + hashlib.sha1(fingerprint).hexdigest()
+
+
+def enqueue_sms_reply(data, sender, message, received_at):
+    """Store an inbound SMS; returns False if this message id was already seen"""
+    message_id = sms_message_id(data, sender, message, received_at)
+    with closing(state_db()) as conn, conn:
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO sms_inbox "
+            "(message_id, sender, message, received_at, payload, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (message_id, sender, message, received_at, json.dumps(data),
+             datetime.now().isoformat()))
+    if cursor.rowcount:
+        _sms_inbox_wakeup.set()
+        return True
+    print(f"Duplicate SMS webhook ignored: {message_id}")
+    return False
+
+
+def process_sms_inbox():
+    """
+    Apply queued replies in arrival order. Changes to the same date are
+    applied together; a later reply for the same row wins.
+    Returns (processed, failed).
+    """
+    with try_process_lock('sms_inbox') as acquired:
+        if not acquired:
+            return 0, 0
+
+        with closing(state_db()) as conn:
+            return _process_sms_inbox_batch(conn)
+
+
+def _process_sms_inbox_batch(conn):
+    items = conn.execute(
+        "SELECT seq, sender, message, received_at, attempts FROM sms_inbox "
+        "WHERE status = 'queued' ORDER BY seq LIMIT ?",
+        (SMS_INBOX_BATCH_SIZE,)).fetchall()
+    if not items:
+        return 0, 0
+
+    by_sheet = {}  # sheet_name -> {'items': [...], 'changes': {row_number: fields}}
+    unmatched = []
+    failed = 0
+
+    def finish(seqs, status, error=None):
+        with conn:
+            conn.executemany(
+                "UPDATE sms_inbox SET status = ?, last_error = ? WHERE seq = ?",
+                [(status, error, seq) for seq in seqs])
+
+    def retry_or_fail(batch, error):
+        retry = [i[0] for i in batch if i[4] + 1 < SMS_INBOX_MAX_ATTEMPTS]
+        give_up = [i for i in batch if i[4] + 1 >= SMS_INBOX_MAX_ATTEMPTS]
+        with conn:
+            conn.executemany(
+                "UPDATE sms_inbox SET attempts = attempts + 1, last_error = ? WHERE seq = ?",
+                [(str(error), seq) for seq in retry])
+        if give_up:
+            finish([i[0] for i in give_up], 'failed', str(error))
+            for _, sender, message, received_at, _ in give_up:
+                log_unknown_reply(sender, message, received_at)
+
+    for item in items:
+        seq, sender, message, received_at, attempts = item
+        print(f"Looking for reservation with phone: {sender}")
+        try:
+            match = resolve_sms_reply(sender, received_at)
+            if match:
+                sheet_name, row_number, name = match
+                fields = sms_reply_fields(message, received_at)
+        except Exception as e:
+            print(f"Error resolving SMS reply {seq}: {e}")
+            retry_or_fail([item], e)
+            failed += 1
+            continue
+
+        if not match:
+            unmatched.append(item)
+            continue
+
+        print(f"Reply from {name}: {message.strip()} -> {fields['confirmed']}")
+        group = by_sheet.setdefault(sheet_name, {'items': [], 'changes': {}})
+        group['items'].append(item)
+        group['changes'][row_number] = fields
+
+    for sheet_name, group in by_sheet.items():
+        try:
+            change_reservations(sheet_name, group['changes'], 'sms_reply')
+        except Exception as e:
+            print(f"Error applying SMS replies to {sheet_name}: {e}")
+            retry_or_fail(group['items'], e)
+            failed += len(group['items'])
+            continue
+
+        finish([i[0] for i in group['items']], 'processed')
+        print(f"✓ Applied {len(group['items'])} SMS reply(s) to {sheet_name}")
+
+    for seq, sender, message, received_at, _ in unmatched:
+        log_unknown_reply(sender, message, received_at)
+        finish([seq], 'unmatched')
+
+    return len(items) - failed, failed
+
+
+def purge_sms_inbox():
+    cutoff = (datetime.now() - timedelta(days=SMS_INBOX_RETENTION_DAYS)).isoformat()
+    with closing(state_db()) as conn, conn:
+        conn.execute(
+            "DELETE FROM sms_inbox WHERE status != 'queued' AND created_at < ?", (cutoff,))
+
+
+def _sms_inbox_consumer():
+    """Background loop draining the SMS inbox, backing off on failure"""
+    delay = SMS_INBOX_POLL_INTERVAL
+    last_purge = None
+    while True:
+        if _sms_inbox_wakeup.wait(delay):
+            sleep(SMS_INBOX_BATCH_WINDOW)
+        _sms_inbox_wakeup.clear()
+        try:
+            processed, failed = process_sms_inbox()
+            if processed == SMS_INBOX_BATCH_SIZE:
+                _sms_inbox_wakeup.set()  # More queued; go again straight away
+            if last_purge is None or monotonic() - last_purge > 3600:
+                purge_sms_inbox()
+                last_purge = monotonic()
+        except Exception as e:
+            print(f"SMS inbox error: {e}")
+            failed = 1
+        delay = min(delay * 2, SMS_INBOX_MAX_BACKOFF) if failed else SMS_INBOX_POLL_INTERVAL
+
+
+init_sms_inbox()
+threading.Thread(target=_sms_inbox_consumer, name='sms-inbox', daemon=True).start()
+
+
 def get_reservation_date_from_sms(received_at):
     """
     Determine which date sheet to check based on SMS data
-    Returns a list of possible sheet names to check
+    Returns the reply's local (Sydney) date as a sheet name
     """
 
     # Method 2: Use received_at as fallback
@@ -731,6 +4517,8 @@ def get_reservation_date_from_sms(received_at):
             # Parse ISO format: "2024-09-30T14:35:00Z"
             received_datetime = datetime.fromisoformat(
                 received_at.replace('Z', '+00:00'))
+            if received_datetime.tzinfo is not None:
+                received_datetime = received_datetime.astimezone(sydney_tz)
 
             # Check same day (for day_of messages)
             same_day = received_datetime.strftime('%Y-%m-%d')
@@ -742,79 +4530,68 @@ def get_reservation_date_from_sms(received_at):
     return None
 
 
+def classify_sms_reply(message):
+    """Map a reply to (status, confirmation method)"""
+    message_upper = message.strip().upper()
+
+    if message_upper in ['Y', 'YES', 'YEP', 'YUP', 'CONFIRM', 'CONFIRMED']:
+        return "Confirmed", "Confirmed by SMS"
+    elif message_upper in ['N', 'NO', 'NOPE', 'CANCEL', 'CANCELLED']:
+        return "Cancelled", "Cancelled by SMS"
+    return f"Reply needs review: {message}", "SMS"
+
+
+def sms_reply_fields(message, received_at):
+    """The status, SMS Reply and Confirmation Method a reply sets on its reservation"""
+    # Format reply timestamp
+    reply_timestamp = datetime.fromisoformat(
+        received_at.replace('Z', '+00:00')
+    ).strftime('%Y-%m-%d %H:%M')
+    status, method = classify_sms_reply(message)
+
+    return {
+        'confirmed': status,
+        'sms_reply': f"{reply_timestamp}: {message}",
+        'confirmation_method': method,
+    }
+
+
+def resolve_sms_reply(phone_number, received_at):
+    """
+    Find the reservation a reply belongs to, judged by the reply's local date.
+    Returns (sheet_name, row_number, name) or None.
+    """
+    parsed_date = get_reservation_date_from_sms(received_at)
+    print(f"the parsed date is {parsed_date}")
+    if not parsed_date:
+        print("⚠ Could not determine reservation date")
+        return None
+
+    return reservation_store.find_by_phone(phone_number, parsed_date)
+
+
 def process_sms_reply_smart(phone_number, message, received_at):
     """
-    Smart SMS reply processing - goes directly to the correct date sheet
-    No phone index needed!
+    Smart SMS reply processing - resolves the reservation through the
+    reservation store using the reply's local date
     """
     try:
 
         print(f"Looking for reservation with phone: {phone_number}")
 
-        # Get possible date sheets to check
-        parsed_date = get_reservation_date_from_sms(received_at)
-        print(f"the parsed date is {parsed_date}")
-        if not parsed_date:
-            print("⚠ Could not determine reservation date")
-            log_unknown_reply(phone_number, message, received_at)
-            return False
-
         try:
-            date_sheet = spreadsheet.worksheet(parsed_date)
-            cell = date_sheet.find(phone_number, in_column=4)
-
-            if cell:
-                print(f"✓ Found reservation in {date_sheet}, row {cell.row}")
-
-                # Get the row data
-                row_data = date_sheet.row_values(cell.row)
-                name = row_data[0] if len(row_data) > 0 else "Unknown"
-
-                # Format reply timestamp
-                reply_timestamp = datetime.fromisoformat(
-                    received_at.replace('Z', '+00:00')
-                ).strftime('%Y-%m-%d %H:%M')
-                full_reply = f"{reply_timestamp}: {message}"
-                print(full_reply + "full reply")
-
-                # Determine status based on message
-                message_upper = message.strip().upper()
-
-                if message_upper in ['Y', 'YES', 'YEP', 'YUP', 'CONFIRM', 'CONFIRMED']:
-                    status = "Confirmed"
-                    method = "Confirmed by SMS"
-                    print(f"✓ Reservation CONFIRMED for {name}")
-                elif message_upper in ['N', 'NO', 'NOPE', 'CANCEL', 'CANCELLED']:
-                    status = "Cancelled"
-                    method = "Cancelled by SMS"
-                    print(f"✗ Reservation CANCELLED for {name}")
-                else:
-                    status = f"Reply needs review: {message}"
-                    method = "SMS"
-                    print(f"⚠ Reply needs manual review: {message}")
-                # Batch update both columns
-                date_sheet.batch_update([
-                    {
-                        'range': f'I{cell.row}',  # Column I: Confirmed status
-                        'values': [[status]]
-                    },
-                    {
-                        'range': f'K{cell.row}',  # Column L: SMS Reply
-                        'values': [[full_reply]]
-                    },
-                    {
-                        'range': f'L{cell.row}',
-                        'values': [[method]]
-                    }
-                ])
+            match = resolve_sms_reply(phone_number, received_at)
+            if match:
+                sheet_name, row_number, name = match
+                fields = sms_reply_fields(message, received_at)
+                print(f"Reply from {name}: {message.strip()} -> {fields['confirmed']}")
+                change_reservations(sheet_name, {row_number: fields}, 'sms_reply')
 
                 print(f"✓ Updated reservation for {name}")
                 return True
 
-        except gspread.WorksheetNotFound:
-            print(f"Sheet not found: {date_sheet}")
         except Exception as e:
-            print(f"Error checking sheet {date_sheet}: {e}")
+            print(f"Error updating reservation for {phone_number}: {e}")
 
         log_unknown_reply(phone_number, message, received_at)
         return False
@@ -829,9 +4606,9 @@ def log_unknown_reply(phone_number, message, received_at):
     """Log replies that couldn't be matched to a reservation"""
     try:
         try:
-            unknown_sheet = spreadsheet.worksheet("Unknown Replies")
+            unknown_sheet = get_worksheet("Unknown Replies")
         except gspread.WorksheetNotFound:
-            unknown_sheet = spreadsheet.add_worksheet(
+            unknown_sheet = add_worksheet(
                 "Unknown Replies", rows=100, cols=5)
             unknown_sheet.update(
                 'A1:E1', [['Timestamp', 'Phone Number', 'Message', 'Received At', 'Status']])
@@ -850,6 +4627,54 @@ def log_unknown_reply(phone_number, message, received_at):
         print(f"Error logging unknown reply: {e}")
 
 
+# =============================================================================
+# METRICS ENDPOINT
+# =============================================================================
+
+
+def _queue_depths():
+    with closing(state_db()) as conn:
+        journal = conn.execute("SELECT COUNT(*) FROM reservation_journal").fetchone()[0]
+        inbox = conn.execute(
+            "SELECT COUNT(*) FROM sms_inbox WHERE status = 'queued'").fetchone()[0]
+        mirror = conn.execute("SELECT COUNT(*) FROM sheet_mirror").fetchone()[0] \
+            if isinstance(reservation_store, SQLiteReservationStore) else 0
+    return {(('queue', 'reservation_journal'),): journal,
+            (('queue', 'sheet_mirror'),): mirror,
+            (('queue', 'sms_inbox'),): inbox,
+            (('queue', 'email'),): email_queue.qsize()}
+
+
+metrics.gauge('queue_depth', 'Items waiting in background queues', _queue_depths)
+metrics.gauge('reservation_cache_dates', 'Dates held in the reservation cache',
+              lambda: len(reservation_cache))
+metrics.gauge('phone_index_reservations', 'Reservations in the phone index',
+              lambda: len(phone_index))
+metrics.gauge('dashboard_streams_open', 'Dashboard change-feed streams open',
+              lambda: _open_streams)
+
+
+@app.route("/ready")
+def readiness():
+    """200 once Google Sheets is connected and the date indexes are loaded, else 503"""
+    backends = {
+        'google_sheets': sheet.status(),
+        'date_indexes': {'ready': date_indexes_warmed_at is not None,
+                         'warmed_at': date_indexes_warmed_at},
+        # Followers don't run the scheduler; they only need to be able to take over
+        'scheduler': {'ready': scheduler_active() or _scheduler_lease is None,
+                      'leader': _scheduler_lease is not None},
+    }
+    ready = all(b['ready'] for b in backends.values())
+    return jsonify({'ready': ready, 'backends': backends}), 200 if ready else 503
+
+
+@app.route("/metrics")
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+
 # =============================================================================
 # TEST ROUTES
 # =============================================================================
@@ -889,7 +4714,7 @@ def test_scheduler():
         })
 
     return jsonify({
-        'scheduler_running': scheduler.running,
+        'scheduler_running': scheduler_active(),
         'jobs': job_info,
         'current_time': datetime.now().isoformat()
     })
@@ -903,14 +4728,17 @@ def scheduler_status():
     for job in jobs:
         job_list.append({
             'id': job.id,
-            'next_run': str(job.next_run_time),
+            'next_run': str(getattr(job, 'next_run_time', None)),
             'function': job.func.__name__
         })
 
     return jsonify({
-        'scheduler_running': scheduler.running,
+        'scheduler_running': scheduler_active(),
+        'scheduler_leader': _scheduler_lease is not None,
+        'pid': os.getpid(),
         'total_jobs': len(jobs),
         'jobs': job_list,
+        'email_queue': email_queue_status(),
         'current_time': datetime.now().isoformat()
     })
 
@@ -948,17 +4776,20 @@ def test_env():
 @app.route("/test-email")
 def test_email():
     try:
-        response = requests.post(
-            "https://api.resend.com/emails",
-            headers={"Authorization": f"Bearer {os.environ.get('RESEND_API_KEY')}"},
-            json={
-                "from": "JLD Hotpot <reservations@jiulongding.com.au>",
-                "to": [os.environ.get('EMAIL_ADDRESS')],
-                "subject": "JLD Email Test",
-                "text": "Test email from JLD reservation system."
-            },
-            timeout=10
-        )
+        with track_outbound('resend', 'test_email') as call:
+            response = email_http.post(
+                RESEND_API_URL,
+                headers={"Authorization": f"Bearer {os.environ.get('RESEND_API_KEY')}"},
+                json={
+                    "from": "JLD Hotpot <reservations@jiulongding.com.au>",
+                    "to": [os.environ.get('EMAIL_ADDRESS')],
+                    "subject": "JLD Email Test",
+                    "text": "Test email from JLD reservation system."
+                },
+                timeout=HTTP_TIMEOUT
+            )
+            if response.status_code != 200:
+                call['outcome'] = f'http_{response.status_code}'
         if response.status_code == 200:
             return "✅ Resend email sent successfully!"
         return f"❌ Resend error {response.status_code}: {response.text}"
@@ -0,0 +1,292 @@
+"""
+In-process stand-ins for the services app.py talks to, so it can be
+imported and driven without Google credentials or network access.
+
+FakeClient/FakeSpreadsheet/FakeWorksheet implement the gspread methods the
+app uses; FakeHTTPSession replaces the Mobile Message and Resend sessions.
+Every fake counts its calls and can add per-call latency and inject quota
+(429) or server errors at a given rate.
+"""
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+import gspread
+import requests
+from gspread.utils import a1_to_rowcol
+
+
+class FaultInjector:
+    """Shared latency / error settings and a call counter for one service"""
+
+    def __init__(self, name, latency=0.0, jitter=0.0, error_rate=0.0, error_status=429, seed=None):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def hit(self, kind, operation):
+        """Record a call, sleep for the simulated latency and maybe fail it"""
+        with self._lock:
+            self.calls[(kind, operation)] += 1
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+        if delay:
+            time.sleep(delay)
+        return self.error_status if fail else None
+
+    def total(self, kind=None):
+        with self._lock:
+            return sum(n for (k, _), n in self.calls.items() if kind is None or k == kind)
+
+
+def _api_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = (
+        '{"error": {"code": %d, "message": "simulated error", "status": "SIMULATED"}}' % status
+    ).encode()
+    return gspread.exceptions.APIError(response)
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, sheet_id):
+        self._spreadsheet = spreadsheet
+        self.title = title
+        self.id = sheet_id
+        self.rows = []
+        self._lock = threading.Lock()
+
+    def _call(self, kind, operation):
+        status = self._spreadsheet.faults.hit(kind, operation)
+        if status:
+            raise _api_error(status)
+
+    def _row(self, number):
+        while len(self.rows) < number:
+            self.rows.append([])
+        return self.rows[number - 1]
+
+    def _set(self, row, col, value):
+        cells = self._row(row)
+        while len(cells) < col:
+            cells.append('')
+        cells[col - 1] = '' if value is None else str(value)
+
+    # Reads
+
+    def get_all_values(self, *args, **kwargs):
+        self._call('read', 'get_all_values')
+        with self._lock:
+            width = max((len(r) for r in self.rows), default=0)
+            return [r + [''] * (width - len(r)) for r in self.rows]
+
+    def row_values(self, row, **kwargs):
+        self._call('read', 'row_values')
+        with self._lock:
+            return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col, **kwargs):
+        self._call('read', 'col_values')
+        with self._lock:
+            return [r[col - 1] if len(r) >= col else '' for r in self.rows]
+
+    def find(self, query, in_row=None, in_column=None, **kwargs):
+        self._call('read', 'find')
+        with self._lock:
+            for i, row in enumerate(self.rows, start=1):
+                for j, value in enumerate(row, start=1):
+                    if in_column and j != in_column:
+                        continue
+                    if value == query:
+                        return gspread.Cell(i, j, value)
+        return None
+
+    # Writes
+
+    def append_row(self, values, **kwargs):
+        return self.append_rows([values], _operation='append_row')
+
+    def append_rows(self, values, _operation='append_rows', **kwargs):
+        self._call('write', _operation)
+        with self._lock:
+            start = len(self.rows) + 1
+            self.rows.extend([['' if v is None else str(v) for v in row] for row in values])
+            end = len(self.rows)
+        return {'updates': {'updatedRange': f"'{self.title}'!A{start}:L{end}",
+                            'updatedRows': len(values)}}
+
+    def update_cell(self, row, col, value):
+        self._call('write', 'update_cell')
+        with self._lock:
+            self._set(row, col, value)
+
+    def update(self, range_name=None, values=None, **kwargs):
+        self._call('write', 'update')
+        row, col = a1_to_rowcol(range_name.split(':')[0])
+        with self._lock:
+            for i, row_values in enumerate(values):
+                for j, value in enumerate(row_values):
+                    self._set(row + i, col + j, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call('write', 'batch_update')
+        with self._lock:
+            for item in data:
+                row, col = a1_to_rowcol(item['range'].split('!')[-1].split(':')[0])
+                for i, row_values in enumerate(item['values']):
+                    for j, value in enumerate(row_values):
+                        self._set(row + i, col + j, value)
+
+    def format(self, *args, **kwargs):
+        self._call('write', 'format')
+
+
+class FakeSpreadsheet:
+    def __init__(self, title, faults):
+        self.title = title
+        self.faults = faults
+        self._sheets = {}
+        self._lock = threading.Lock()
+
+    def _call(self, kind, operation):
+        status = self.faults.hit(kind, operation)
+        if status:
+            raise _api_error(status)
+
+    def seed_worksheet(self, title, rows=()):
+        """Create a worksheet without counting an API call"""
+        with self._lock:
+            ws = FakeWorksheet(self, title, len(self._sheets))
+            ws.rows = [list(map(str, r)) for r in rows]
+            self._sheets[title] = ws
+        return ws
+
+    def worksheet(self, title):
+        self._call('read', 'worksheet')
+        with self._lock:
+            if title not in self._sheets:
+                raise gspread.WorksheetNotFound(title)
+            return self._sheets[title]
+
+    def worksheets(self, *args, **kwargs):
+        self._call('read', 'worksheets')
+        with self._lock:
+            return list(self._sheets.values())
+
+    def get_worksheet(self, index):
+        self._call('read', 'get_worksheet')
+        with self._lock:
+            return list(self._sheets.values())[index]
+
+    def add_worksheet(self, title, rows=100, cols=26, index=None):
+        self._call('write', 'add_worksheet')
+        with self._lock:
+            if title in self._sheets:
+                raise _api_error(400)
+        return self.seed_worksheet(title)
+
+    def values_batch_get(self, ranges, params=None):
+        self._call('read', 'values_batch_get')
+        value_ranges = []
+        for range_name in ranges:
+            title = range_name.rsplit('!', 1)[0].strip("'")
+            with self._lock:
+                ws = self._sheets.get(title)
+            rows = [list(r) for r in ws.rows] if ws else []
+            value_ranges.append({'range': range_name, 'values': rows})
+        return {'spreadsheetId': 'fake', 'valueRanges': value_ranges}
+
+    def batch_update(self, body):
+        """Supports the addSheet and updateCells requests app.py sends"""
+        self._call('write', 'batch_update')
+        replies = []
+        with self._lock:
+            by_id = {ws.id: ws for ws in self._sheets.values()}
+            added = [r['addSheet']['properties'] for r in body['requests'] if 'addSheet' in r]
+            if any(p['title'] in self._sheets or p.get('sheetId') in by_id for p in added):
+                raise _api_error(400)
+        for request in body['requests']:
+            if 'addSheet' in request:
+                properties = request['addSheet']['properties']
+                ws = self.seed_worksheet(properties['title'])
+                ws.id = properties.get('sheetId', ws.id)
+                by_id[ws.id] = ws
+                replies.append({'addSheet': {'properties': {'sheetId': ws.id, 'title': ws.title}}})
+            elif 'updateCells' in request:
+                update = request['updateCells']
+                ws = by_id[update['start']['sheetId']]
+                with ws._lock:
+                    for i, row in enumerate(update['rows']):
+                        for j, cell in enumerate(row['values']):
+                            value = cell.get('userEnteredValue', {})
+                            ws._set(update['start']['rowIndex'] + i + 1,
+                                    update['start']['columnIndex'] + j + 1,
+                                    next(iter(value.values()), ''))
+                replies.append({})
+            else:
+                replies.append({})
+        return {'replies': replies}
+
+
+class FakeClient:
+    """Stands in for gspread.Client; every open() returns the same spreadsheet"""
+
+    def __init__(self, faults):
+        self.faults = faults
+        self.spreadsheet = FakeSpreadsheet("Restaurant Reservations", faults)
+        self.timeout = None
+
+    def set_timeout(self, timeout):
+        self.timeout = timeout
+
+    def open(self, title):
+        self.faults.hit('read', 'open')
+        return self.spreadsheet
+
+
+class FakeResponse:
+    def __init__(self, status_code, payload):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = str(payload)
+
+    def json(self):
+        return self._payload
+
+
+class FakeHTTPSession:
+    """
+    Replaces a requests.Session for one provider. Mobile Message requests get
+    a per-message "results" list; anything else gets {"id": ...}.
+    """
+
+    def __init__(self, faults):
+        self.faults = faults
+        self._ids = 0
+        self._lock = threading.Lock()
+
+    def _next_id(self):
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def post(self, url, json=None, **kwargs):
+        status = self.faults.hit('post', re.sub(r'^https?://', '', url))
+        if status:
+            return FakeResponse(status, {'error': 'simulated'})
+        if json and 'messages' in json:
+            results = [dict(m, status='success', message_id=f'fake-{self._next_id()}', cost=1)
+                       for m in json['messages']]
+            return FakeResponse(200, {'status': 'complete', 'results': results})
+        return FakeResponse(200, {'id': f'fake-{self._next_id()}'})
+
+    def get(self, url, **kwargs):
+        status = self.faults.hit('get', re.sub(r'^https?://', '', url))
+        return FakeResponse(status or 200, {})
@@ -0,0 +1,231 @@
+"""
+Benchmark the reservation hot paths in app.py against in-process fakes.
+
+    python benchmarks/run.py --bookings 300 --sheets-latency 0.2 --sms-latency 0.3
+
+Drives submit_reservation_route, get_reservations (single day and range),
+send_sms_on_date and receive_sms through Flask's test client and reports
+throughput, p50/p99 latency and outbound calls per operation. Background work (journal flush,
+SMS inbox drain, mirroring row changes to Sheets, email sending) is run explicitly and
+reported separately. Set RESERVATION_STORE=sheets to measure the Sheets-backed store.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from time import perf_counter
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fakes import FakeClient, FakeHTTPSession, FaultInjector  # noqa: E402
+
+TIMES = ["12:00", "12:30", "13:00", "13:30", "18:00",
+         "18:30", "19:00", "19:30", "20:00", "20:30"]
+PARTY_SIZES = ["1-2", "3-4", "4-6", "7-10"]
+DISHES = ["大火锅", "小火锅", "炒菜"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--bookings', type=int, default=300, help='bookings submitted for the busy day')
+    parser.add_argument('--days', type=int, default=7, help='days the bookings are spread over for reads')
+    parser.add_argument('--dashboard-reads', type=int, default=200, help='dashboard API requests')
+    parser.add_argument('--burst', type=int, default=150, help='inbound SMS replies in the webhook burst')
+    parser.add_argument('--history', type=int, default=5000, help='existing Master Data rows')
+    parser.add_argument('--sheets-latency', type=float, default=0.0, help='seconds added to every Sheets call')
+    parser.add_argument('--sheets-error-rate', type=float, default=0.0, help='fraction of Sheets calls failing with 429')
+    parser.add_argument('--sms-latency', type=float, default=0.0, help='seconds added to every Mobile Message call')
+    parser.add_argument('--email-latency', type=float, default=0.0, help='seconds added to every Resend call')
+    parser.add_argument('--provider-error-rate', type=float, default=0.0, help='fraction of SMS/email calls failing with 503')
+    parser.add_argument('--slot-capacity', type=int, default=100000, help='seats per time slot (app default: 40)')
+    parser.add_argument('--sheets-rpm', type=float, default=6000, help='quota per lane given to the app (Google: 60)')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    return parser.parse_args()
+
+
+def load_app(args, sheets_faults, sms_faults, email_faults):
+    """Import app.py against the fakes with background loops parked"""
+    os.environ['STATE_DIR'] = tempfile.mkdtemp(prefix='jld-bench-')
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    os.environ['SHEETS_READS_PER_MINUTE'] = str(args.sheets_rpm)
+    os.environ['SHEETS_WRITES_PER_MINUTE'] = str(args.sheets_rpm)
+    os.environ['SLOT_CAPACITY'] = str(args.slot_capacity)
+    # Every booking comes from the test client's one address
+    os.environ['SUBMIT_RATE_PER_MINUTE'] = '1000000'
+    os.environ['SUBMIT_BURST'] = '1000'
+    os.environ['SHEETS_BACKOFF_BASE'] = '0.05'
+    os.environ['EMAIL_RETRY_BASE_DELAY'] = '0.05'
+    # Park the flusher and inbox consumer; the harness drains them itself
+    os.environ['JOURNAL_FLUSH_INTERVAL'] = '86400'
+    os.environ['SMS_INBOX_POLL_INTERVAL'] = '86400'
+
+    client = FakeClient(sheets_faults)
+    client.spreadsheet.seed_worksheet('Master Data', [
+        ['ID', 'Name', 'Date', 'Time', 'People', 'Dish Type', 'Phone', 'Email', 'Notes']
+    ] + [[i, f'Guest {i}', '2024-01-01', '18:00', '1-2', '炒菜', '61400000000', 'g@example.com', '']
+         for i in range(1, args.history + 1)])
+
+    # Left patched: app.py connects lazily, after the import returns
+    mock.patch('oauth2client.service_account.ServiceAccountCredentials.from_json_keyfile_name').start()
+    mock.patch('gspread.authorize', return_value=client).start()
+    import app as app_module
+
+    app_module.sms_http = FakeHTTPSession(sms_faults)
+    app_module.email_http = FakeHTTPSession(email_faults)
+    app_module.ping_http = FakeHTTPSession(email_faults)
+    app_module._journal_wakeup = threading.Event()
+    app_module._sms_inbox_wakeup = threading.Event()
+    for thread in threading.enumerate():
+        if thread.name in ('asset-build', 'backend-warmup'):
+            thread.join()  # Keep start-up work out of the timings
+    return app_module, client
+
+
+class Quiet:
+    """Silence app.py's print() logging while an operation runs"""
+
+    def __enter__(self):
+        self._stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self._stdout
+
+
+def percentile(samples, q):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+class Recorder:
+    def __init__(self, services):
+        self.services = services
+        self.results = []
+
+    def _snapshot(self):
+        snapshot = {}
+        for faults in self.services:
+            for (kind, _), n in list(faults.calls.items()):
+                key = f'{faults.name}_{kind}'
+                snapshot[key] = snapshot.get(key, 0) + n
+        return snapshot
+
+    def run(self, name, operations):
+        """Time each callable in `operations`; record latency and outbound calls"""
+        before = self._snapshot()
+        latencies = []
+        started = perf_counter()
+        with Quiet():
+            for operation in operations:
+                t0 = perf_counter()
+                operation()
+                latencies.append(perf_counter() - t0)
+        elapsed = perf_counter() - started
+        after = self._snapshot()
+
+        count = len(latencies)
+        calls = {k: after.get(k, 0) - before.get(k, 0) for k in after}
+        self.results.append({
+            'operation': name,
+            'count': count,
+            'seconds': elapsed,
+            'throughput': count / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+            'calls_per_op': {k: v / count for k, v in calls.items() if v and count},
+        })
+
+    def report(self):
+        print(f"{'operation':<28}{'n':>6}{'ops/s':>10}{'p50 ms':>10}{'p99 ms':>10}  outbound calls/op")
+        for r in self.results:
+            calls = ', '.join(f'{k}={v:.2f}' for k, v in sorted(r['calls_per_op'].items())) or '-'
+            print(f"{r['operation']:<28}{r['count']:>6}{r['throughput']:>10.1f}"
+                  f"{r['p50_ms']:>10.2f}{r['p99_ms']:>10.2f}  {calls}")
+
+
+def main():
+    args = parse_args()
+    rng = random.Random(args.seed)
+    sheets_faults = FaultInjector('sheets', args.sheets_latency, error_rate=args.sheets_error_rate,
+                                  error_status=429, seed=args.seed)
+    sms_faults = FaultInjector('sms', args.sms_latency, error_rate=args.provider_error_rate,
+                               error_status=503, seed=args.seed)
+    email_faults = FaultInjector('email', args.email_latency, error_rate=args.provider_error_rate,
+                                 error_status=503, seed=args.seed)
+
+    with Quiet():
+        app_module, _ = load_app(args, sheets_faults, sms_faults, email_faults)
+    client = app_module.app.test_client()
+    with client.session_transaction() as session:
+        session['staff_authenticated'] = True
+
+    start_day = datetime.now(app_module.sydney_tz).date() + timedelta(days=1)
+    dates = [(start_day + timedelta(days=i)).strftime('%Y-%m-%d') for i in range(args.days)]
+    busy_day = dates[0]
+    recorder = Recorder([sheets_faults, sms_faults, email_faults])
+
+    def submit(i, date):
+        form = {
+            'name': f'Guest {i}', 'email': f'guest{i}@example.com',
+            'phone': f'04{10000000 + i:08d}', 'people': rng.choice(PARTY_SIZES),
+            'date': date, 'time': rng.choice(TIMES), 'dish-type': rng.choice(DISHES),
+            'notes': '',
+        }
+        return lambda: client.post('/submit_reservation', data=form)
+
+    bookings = [submit(i, busy_day) for i in range(args.bookings)]
+    bookings += [submit(args.bookings + i, rng.choice(dates[1:] or dates))
+                 for i in range(args.bookings // 2)]
+    recorder.run('submit_reservation', bookings)
+    recorder.run('journal flush (background)',
+                 [lambda: app_module.flush_reservation_journal()
+                  for _ in range(max(1, -(-len(bookings) // app_module.JOURNAL_BATCH_SIZE)))])
+    recorder.run('email drain (background)', [app_module.email_queue.join])
+
+    app_module.reservation_cache = app_module.ReservationCache(
+        app_module.RESERVATION_CACHE_TTL, app_module.RESERVATION_CACHE_SIZE)
+    recorder.run('get_reservations',
+                 [(lambda d=rng.choice(dates): client.get(f'/staff/api/reservations/{d}'))
+                  for _ in range(args.dashboard_reads)])
+    app_module.reservation_cache = app_module.ReservationCache(
+        app_module.RESERVATION_CACHE_TTL, app_module.RESERVATION_CACHE_SIZE)
+    recorder.run('get_reservations (range)',
+                 [lambda: client.get(f'/staff/api/reservations/{dates[0]}/{dates[-1]}')
+                  for _ in range(max(1, args.dashboard_reads // 10))])
+
+    recorder.run('send_sms_on_date', [lambda: app_module.send_sms_on_date(busy_day)])
+
+    reply_time = datetime.utcnow().isoformat() + 'Z'
+    replies = [{'message_id': f'reply-{i}', 'sender': f'614{10000000 + i:08d}',
+                'message': rng.choice(['Y', 'Y', 'Y', 'N', 'maybe']), 'received_at': reply_time}
+               for i in range(args.burst)]
+    replies += replies[:args.burst // 10]  # provider retries
+    recorder.run('receive_sms (ack)',
+                 [(lambda r=r: client.post('/sms-webhook', json=r)) for r in replies])
+    recorder.run('sms inbox drain (background)',
+                 [lambda: app_module.process_sms_inbox()
+                  for _ in range(max(1, -(-args.burst // app_module.SMS_INBOX_BATCH_SIZE)))])
+    recorder.run('sheet mirror (background)', [lambda: app_module.flush_reservation_journal()])
+
+    if args.json:
+        print(json.dumps(recorder.results, indent=2))
+    else:
+        recorder.report()
+
+    if app_module.scheduler.running:
+        app_module.scheduler.shutdown(wait=False)
+    os._exit(0)  # app.py's background threads don't need a clean shutdown here
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,19 @@
+"""
+Gunicorn settings, read from the working directory by a plain `gunicorn app:app`.
+
+Workers are threaded: each open dashboard holds a thread on its
+/staff/api/stream connection, and the worker's other threads keep serving
+the booking form and the SMS webhook. app.py caps the streams a worker
+holds (CHANGE_FEED_MAX_STREAMS), so keep that below GUNICORN_THREADS.
+
+On Render (which sets RENDER) requests arrive through one router, so app.py
+trusts one X-Forwarded-For hop there unless TRUSTED_PROXIES says otherwise.
+"""
+import os
+
+if os.environ.get('RENDER'):
+    os.environ.setdefault('TRUSTED_PROXIES', '1')
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))